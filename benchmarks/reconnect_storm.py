@@ -0,0 +1,78 @@
+"""
+Skirmish Server
+
+Benchmark of reconnect storms (e.g. all phasers reconnecting after an access
+point handover): joins N clients and lets all of them rejoin from new sockets
+at once, prints the time per join and rejoin. The time includes the lookup of
+the access token in the database.
+
+Run from the base directory of this git: python3 -m benchmarks.reconnect_storm
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+
+# Importing skirmserv initializes the app, use a throw-away database
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import time
+from hashlib import sha256
+from secrets import token_urlsafe
+
+from skirmserv import app
+from skirmserv.models.user import UserModel
+from skirmserv.communication.client_manager import ClientManager
+
+CLIENT_COUNTS = (100, 500, 2000)
+
+
+def create_users(count: int) -> list:
+    """Creates count users and returns their plaintext access tokens. The
+    users are inserted directly, hashing passwords would take too long"""
+    tokens = [token_urlsafe(32) for i in range(count)]
+    UserModel.insert_many(
+        [
+            {
+                "name": "Phaser{0}".format(i),
+                "email": "phaser{0}@example.com".format(i),
+                "access_token": sha256(token.encode("ASCII")).hexdigest(),
+            }
+            for i, token in enumerate(tokens)
+        ]
+    ).execute()
+    return tokens
+
+
+def bench(tokens: list) -> None:
+    manager = ClientManager.get_instance()
+    manager.clients.clear()
+    manager.clients_by_user.clear()
+
+    start = time.perf_counter()
+    for i, token in enumerate(tokens):
+        ClientManager.join_client(token, "socket-{0}".format(i))
+    join_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, token in enumerate(tokens):
+        ClientManager.join_client(token, "socket-{0}-new".format(i))
+    rejoin_time = time.perf_counter() - start
+
+    assert len(manager.clients) == len(tokens)
+    assert len(manager.clients_by_user) == len(tokens)
+
+    print(
+        "{0:>5} clients  join {1:7.1f} us  rejoin {2:7.1f} us".format(
+            len(tokens),
+            join_time / len(tokens) * 1e6,
+            rejoin_time / len(tokens) * 1e6,
+        )
+    )
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        tokens = create_users(max(CLIENT_COUNTS))
+        for count in CLIENT_COUNTS:
+            bench(tokens[:count])
@@ -0,0 +1,93 @@
+"""
+Skirmish Server
+
+Benchmark of the shot deduplication: marks 10^6 hits of shots (one in ten
+reported twice) of 32 players with the ShotStore of a game and with a set of
+all shot ids (like the store replaced by it). Prints the time per hit and the
+memory used by each after all hits.
+
+Run from the base directory of this git: python3 -m benchmarks.shot_dedup
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+
+# Importing skirmserv initializes the app, use a throw-away database
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import random
+import time
+import tracemalloc
+
+from skirmserv.util.shots import ShotStore
+
+HITS = 1000000
+PLAYERS = 32
+SID_RANGE = 65536
+
+
+class ShotSet(object):
+    """All shots ever hit in one set, like the previous deduplication"""
+
+    def __init__(self):
+        self.shots = set()
+
+    def hit(self, shooter: int, sid: int, pid: int) -> bool:
+        psid = (sid << 8 | shooter) << 8 | pid
+        result = psid in self.shots
+        self.shots.add(psid)
+        return result
+
+
+def create_hits(count: int) -> list:
+    """Returns count (shooter, sid, pid) tuples, the sids of every shooter
+    count up and wrap around at SID_RANGE"""
+    sids = [random.randrange(SID_RANGE) for i in range(PLAYERS)]
+    hits = []
+    while len(hits) < count:
+        shooter = random.randrange(PLAYERS)
+        pid = random.randrange(PLAYERS)
+        sids[shooter] = (sids[shooter] + 1) % SID_RANGE
+        hits.append((shooter, sids[shooter], pid))
+
+        # Hits reported by multiple sensors of the player
+        if random.random() < 0.1:
+            hits.append((shooter, sids[shooter], pid))
+    return hits[:count]
+
+
+def mark_hits(store, hits: list) -> int:
+    """Marks all hits, returns the count of duplicates"""
+    duplicates = 0
+    for shooter, sid, pid in hits:
+        duplicates += store.hit(shooter, sid, pid)
+    return duplicates
+
+
+def bench(name: str, create_store, hits: list) -> None:
+    start = time.perf_counter()
+    duplicates = mark_hits(create_store(), hits)
+    duration = time.perf_counter() - start
+
+    # Memory is traced in a second run, tracing slows down the first
+    tracemalloc.start()
+    store = create_store()
+    mark_hits(store, hits)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(
+        "{0:<10} {1:7.3f} us/hit  {2:9.1f} KiB  {3} duplicates".format(
+            name, duration / len(hits) * 1e6, memory / 1024, duplicates
+        )
+    )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    hits = create_hits(HITS)
+    print("{0} hits, {1} players".format(HITS, PLAYERS))
+
+    bench("set", ShotSet, hits)
+    bench("ShotStore", lambda: ShotStore(256, SID_RANGE), hits)
@@ -0,0 +1,135 @@
+"""
+Skirmish Server
+
+Benchmark of concurrent logins and authenticated joins on SQLite with the
+default and the performance profile (see DB_SQLITE_PROFILE). Login threads
+rotate access tokens (the database write of a login, password hashing is not
+included), join threads look users up by access token hash (the token cache
+is bypassed). Prints the operations per second and latencies of both.
+
+Run from the base directory of this git: python3 -m benchmarks.sqlite_concurrency
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+import tempfile
+
+# Importing skirmserv initializes the app, the benchmark databases are
+# created in a temporary directory
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import threading
+import time
+from hashlib import sha256
+
+from peewee import SqliteDatabase
+
+from skirmserv import app
+from skirmserv.models import Database
+from skirmserv.models.user import UserModel
+from skirmserv.util.stats import percentiles
+
+USER_COUNT = 1000
+LOGIN_THREADS = 4
+JOIN_THREADS = 8
+DURATION = 3
+
+
+def create_database(path: str, profile: str) -> SqliteDatabase:
+    """Creates a database with the given profile and USER_COUNT users"""
+    app.config.update({"DB_SQLITE_PROFILE": profile})
+    db = SqliteDatabase(
+        path,
+        pragmas=Database.instance.get_sqlite_pragmas(),
+        timeout=float(app.config["DB_SQLITE_BUSY_TIMEOUT"]),
+        check_same_thread=False,
+    )
+    db.bind([UserModel])
+    db.create_tables([UserModel])
+
+    with db.atomic():
+        UserModel.insert_many(
+            [
+                {
+                    "name": "Phaser{0}".format(i),
+                    "email": "phaser{0}@example.com".format(i),
+                    "access_token": sha256(str(i).encode("ASCII")).hexdigest(),
+                }
+                for i in range(USER_COUNT)
+            ]
+        ).execute()
+    return db
+
+
+def login(user_id: int) -> None:
+    user = UserModel.get_by_id(user_id)
+    user.generate_access_token()
+
+
+def join(user_id: int) -> None:
+    token_hash = sha256(str(user_id).encode("ASCII")).hexdigest()
+    UserModel.get_or_none(UserModel.access_token == token_hash)
+
+
+def worker(db, operation, offset: int, stop: float, latencies: list, errors: list):
+    with app.app_context():
+        i = offset
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                operation(i % USER_COUNT + 1)
+            except Exception as e:
+                errors.append(e)
+            latencies.append(time.perf_counter() - start)
+            i += 7
+        db.close()
+
+
+def bench(directory: str, profile: str) -> None:
+    db = create_database(os.path.join(directory, profile + ".sqlite3"), profile)
+
+    stop = time.monotonic() + DURATION
+    results = {"login": ([], []), "join": ([], [])}
+    threads = []
+    for name, operation, count in (
+        ("login", login, LOGIN_THREADS),
+        ("join", join, JOIN_THREADS),
+    ):
+        for i in range(count):
+            latencies, errors = results[name]
+            threads.append(
+                threading.Thread(
+                    target=worker,
+                    args=(db, operation, i * 100, stop, latencies, errors),
+                )
+            )
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, (latencies, errors) in results.items():
+        p = percentiles(latencies)
+        print(
+            "{0:<12} {1:<6} {2:7.0f} ops/s  p50 {3:7.2f} ms  p99 {4:7.2f} ms"
+            "  errors {5}".format(
+                profile,
+                name,
+                len(latencies) / DURATION,
+                p["p50"] * 1000,
+                p["p99"] * 1000,
+                len(errors),
+            )
+        )
+
+
+if __name__ == "__main__":
+    # Every join has to query the database
+    app.config.update({"TOKEN_CACHE_SIZE": 0})
+    UserModel.token_cache = None
+
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        for profile in ("default", "performance"):
+            bench(directory, profile)
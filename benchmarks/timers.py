@@ -0,0 +1,103 @@
+"""
+Skirmish Server
+
+Benchmark of the timer service with 100k pending timers: the time to add a
+timer, to cancel one and to call the due ones, and the memory used by the
+pending timers. For comparison the same timers are started as background
+tasks sleeping until they are due (one greenlet per timer).
+
+Run from the base directory of this git: python3 -m benchmarks.timers
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+
+# Importing skirmserv initializes the app, use a throw-away database
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import random
+import time
+import tracemalloc
+
+from skirmserv import app, socketio
+from skirmserv.game.timer_service import TimerService
+
+TIMERS = 100000
+DURATION = 600  # Timers are due within this many seconds
+
+
+def nothing() -> None:
+    pass
+
+
+def sleeping_task(delay: float) -> None:
+    socketio.sleep(delay)
+    nothing()
+
+
+def per_op(duration: float) -> str:
+    return "{0:6.2f} us".format(duration / TIMERS * 1e6)
+
+
+def bench_service(delays: list) -> None:
+    service = TimerService.get_instance()
+    now = time.time()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    timers = [service.call_at(now + delay, nothing) for delay in delays]
+    add_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for timer in timers[::2]:
+        timer.cancel()
+    cancel_time = (time.perf_counter() - start) * 2
+
+    # Calls all timers as if the time has passed
+    start = time.perf_counter()
+    fired = service.run_due(now + DURATION)
+    fire_time = time.perf_counter() - start
+
+    print(
+        "TimerService  add {0}  cancel {1}  fire {2}  {3:9.1f} KiB"
+        "  ({4} fired)".format(
+            per_op(add_time),
+            per_op(cancel_time),
+            per_op(fire_time),
+            memory / 1024,
+            fired,
+        )
+    )
+
+
+def bench_tasks(delays: list) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    for delay in delays:
+        socketio.start_background_task(sleeping_task, delay)
+    add_time = time.perf_counter() - start
+
+    # Let the tasks start sleeping
+    socketio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(
+        "task/timer    add {0}  {1:9.1f} KiB  ({2} async mode)".format(
+            per_op(add_time), memory / 1024, socketio.async_mode
+        )
+    )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    delays = [random.uniform(1, DURATION) for i in range(TIMERS)]
+    print("{0} timers".format(TIMERS))
+
+    with app.app_context():
+        bench_service(delays)
+        bench_tasks(delays)
+    os._exit(0)  # Do not wait for the sleeping tasks
@@ -0,0 +1,78 @@
+"""
+Skirmish Server
+
+Benchmark of the user lookups by email (login, registration) and by access
+token hash (socket joins, REST api) with 100k users. Measures the lookups
+with the indexes of the user table and again after dropping them.
+
+Run from the base directory of this git: python3 -m benchmarks.user_lookup
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+
+# Importing skirmserv initializes the app, use a throw-away database
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import random
+import timeit
+from hashlib import sha256
+
+from skirmserv import app
+from skirmserv.models import Database
+from skirmserv.models.user import UserModel
+
+USER_COUNT = 100000
+LOOKUPS = 1000
+
+
+def create_users(count: int) -> None:
+    """Inserts count users directly, hashing passwords would take too long"""
+    db = Database.get()
+    with db.atomic():
+        for start in range(0, count, 1000):
+            UserModel.insert_many(
+                [
+                    {
+                        "name": "Phaser{0}".format(i),
+                        "email": "phaser{0}@example.com".format(i),
+                        "access_token": sha256(str(i).encode("ASCII")).hexdigest(),
+                    }
+                    for i in range(start, min(start + 1000, count))
+                ]
+            ).execute()
+
+
+def bench(name: str) -> None:
+    ids = [random.randrange(USER_COUNT) for i in range(LOOKUPS)]
+    emails = iter(["phaser{0}@example.com".format(i) for i in ids])
+    hashes = iter([sha256(str(i).encode("ASCII")).hexdigest() for i in ids])
+
+    email_time = timeit.timeit(
+        lambda: UserModel.get(UserModel.email == next(emails)), number=LOOKUPS
+    )
+    token_time = timeit.timeit(
+        lambda: UserModel.get(UserModel.access_token == next(hashes)), number=LOOKUPS
+    )
+
+    print(
+        "{0:<16} email {1:9.1f} us  access_token {2:9.1f} us".format(
+            name, email_time / LOOKUPS * 1e6, token_time / LOOKUPS * 1e6
+        )
+    )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+
+    with app.app_context():
+        create_users(USER_COUNT)
+        print("{0} users".format(USER_COUNT))
+
+        bench("with indexes")
+
+        db = Database.get()
+        db.execute_sql('DROP INDEX "usermodel_email"')
+        db.execute_sql('DROP INDEX "usermodel_access_token"')
+        bench("without indexes")
@@ -0,0 +1,91 @@
+"""
+Skirmish Server
+
+Benchmark of the wire formats: encodes and decodes typical phaser messages
+(a full data update and a delta update after a hit) with the JSON and the
+compact MessagePack encoding and prints the time per message and the size.
+MessagePack saves about two thirds of the bytes, with orjson installed JSON
+is encoded faster.
+
+Run from the base directory of this git: python3 -m benchmarks.wire_format
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import os
+
+# Importing skirmserv initializes the app, use a throw-away database
+os.environ.setdefault("DB_LOCATION", ":memory:")
+
+import json
+import timeit
+
+from skirmserv.communication.encoding import available_encodings
+
+FULL_UPDATE = {
+    "a": [12],
+    "p_id": 12,
+    "p_n": "Phaser12",
+    "p_h": 100,
+    "p_p": 4200,
+    "p_cr": 255,
+    "p_cg": 128,
+    "p_cb": 0,
+    "p_cbg": True,
+    "p_al": False,
+    "p_a": 0,
+    "p_pe": True,
+    "p_pdu": 1700000000,
+    "p_msi": 300,
+    "p_r": 3,
+    "p_i": False,
+    "p_iu": 1700000000,
+    "p_ilo": True,
+    "t_id": 2,
+    "t_pc": 20,
+    "t_p": 48000,
+    "t_r": 1,
+    "t_n": "Alive",
+    "g_id": "BoardMiss",
+    "g_pc": 40,
+    "g_tc": 2,
+    "g_st": 1700000000,
+    "g_ca": 1699999000,
+    "g_cb": "Gamemaster",
+}
+
+HIT_UPDATE = {"a": [8], "p_h": 90, "p_pdu": 1700000006, "p_iu": 1700000006}
+
+ROUNDS = 100000
+
+
+def bench(name: str, message: dict) -> None:
+    for encoding in available_encodings.values():
+        encoded = encoding.encode(message)
+
+        # socket.io decodes JSON itself, measure the real parsing work
+        if encoding.name == "json":
+            decode = lambda: json.loads(encoded)
+        else:
+            decode = lambda: encoding.decode(encoded)
+
+        encode_time = timeit.timeit(lambda: encoding.encode(message), number=ROUNDS)
+        decode_time = timeit.timeit(decode, number=ROUNDS)
+
+        print(
+            "{0:<12} {1:<8} {2:>5} bytes  encode {3:6.2f} us  decode {4:6.2f} us".format(
+                name,
+                encoding.name,
+                len(encoded),
+                encode_time / ROUNDS * 1e6,
+                decode_time / ROUNDS * 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    if "msgpack" not in available_encodings:
+        print("msgpack is not installed, only JSON is benchmarked")
+
+    bench("full update", FULL_UPDATE)
+    bench("hit update", HIT_UPDATE)
@@ -9,17 +9,30 @@ from flask_socketio import SocketIO
 from flask_restful import Api
 
 from flask import render_template
+from flask import make_response
 
 from logging.config import dictConfig
 
 from flasgger import Swagger, swag_from
 
+from skirmserv.util import serializer
+
 # Creating Flask app & SocketIO server
 app = Flask(__name__)
 app.config.from_pyfile("config.py")
-socketio = SocketIO(app, cors_allowed_origins="*")  # Socket IO websocket app
+# Socket IO websocket app
+socketio = SocketIO(app, cors_allowed_origins="*", json=serializer)
 flask_api = Api(app)  # Restful api
 
+
+@flask_api.representation("application/json")
+def output_json(data, code, headers=None):
+    """Encodes the responses of the restful api using the shared serializer"""
+    response = make_response(serializer.dumps(data) + "\n", code)
+    response.headers.extend(headers or {})
+    return response
+
+
 SWAGGER_TEMPLATE = {
     "securityDefinitions": {
         "AccessTokenHeader": {
@@ -58,11 +71,25 @@ with app.app_context():
 
     Database()
 
+
+# Return the pooled database connection after every request and socket event
+@app.teardown_appcontext
+def release_database_connection(exception):
+    Database.release()
+
+
 # Create ClientManager and set SocketIO server to receive and send messages
 from skirmserv.communication.client_manager import ClientManager
 
 ClientManager.set_socketio(socketio)
 
+# Start removing idle clients and closing abandoned games in the background
+from skirmserv.game.game_manager import GameManager
+
+with app.app_context():
+    ClientManager.start_reaper()
+    GameManager.start_reaper()
+
 # Register Resources to the API
 from skirmserv.api.user import UserAPI
 from skirmserv.api.user import AuthAPI
@@ -70,6 +97,7 @@ from skirmserv.api.game import GameAPI
 from skirmserv.api.game import GamesAPI
 from skirmserv.api.team import TeamAPI
 from skirmserv.api.gamemode import GamemodeAPI
+from skirmserv.api.stats import StatsAPI
 
 flask_api.add_resource(UserAPI, "/user")
 flask_api.add_resource(AuthAPI, "/auth")
@@ -77,6 +105,7 @@ flask_api.add_resource(GameAPI, "/game/<string:gid>")
 flask_api.add_resource(TeamAPI, "/team/<string:gid>/<int:tid>")
 flask_api.add_resource(GamesAPI, "/games")
 flask_api.add_resource(GamemodeAPI, "/gamemode")
+flask_api.add_resource(StatsAPI, "/stats")
 app.logger.info("Welcome! API + WS up and running.")
 
 
@@ -59,6 +59,7 @@ class GameAPI(Resource):
 
         abort_if_game_is_not_owned(user, game)
 
+        team_ranks = game.get_team_ranks()
         teams = []
         for team in game.teams.values():
             teams.append(
@@ -66,11 +67,12 @@ class GameAPI(Resource):
                     "tid": team.tid,
                     "player_count": team.get_player_count(),
                     "points": team.get_points(),
-                    "rank": team.get_rank(),
+                    "rank": team_ranks.get(team, -1),
                     "name": team.name,
                 }
             )
 
+        player_ranks = game.get_player_ranks()
         players = []
         for player in game.players.values():
             players.append(
@@ -79,7 +81,9 @@ class GameAPI(Resource):
                     "name": player.name,
                     "points": player.points,
                     "health": player.health,
-                    "rank": player.get_rank(),
+                    "rank": player_ranks.get(player, -1),
+                    "rtt": player.client.get_rtt_percentiles(),
+                    "queue": player.client.get_queue_stats(),
                 }
             )
 
@@ -93,6 +97,7 @@ class GameAPI(Resource):
             "created_by": game.created_by.name,
             "teams": teams,
             "players": players,
+            "rtt": game.get_rtt_percentiles(),
         }, 200
 
     @requires_auth
@@ -0,0 +1,32 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from flask_restful import Resource
+
+from flasgger import swag_from
+
+from skirmserv.models import Database
+from skirmserv.models.user import UserModel
+from skirmserv.models.write_behind import WriteBehindQueue
+from skirmserv.game.timer_service import TimerService
+from skirmserv.game.game_manager import GameManager
+from skirmserv.api import requires_auth
+
+
+class StatsAPI(Resource):
+    @requires_auth
+    @swag_from("openapi/stats/get.yml")
+    def get(self, user: UserModel):
+        """Returns statistics about the caches, the database connections,
+        the timers and the games"""
+        return {
+            "token_cache": UserModel.get_token_cache().get_stats(),
+            "token_generations": UserModel.get_token_generations().get_stats(),
+            "database": Database.get_stats(),
+            "write_behind": WriteBehindQueue.get_stats(),
+            "timers": TimerService.get_stats(),
+            "games": GameManager.get_stats(),
+        }, 200
@@ -8,6 +8,8 @@ from flask_restful import Resource
 from flask_restful import reqparse
 from flask_restful import abort
 
+from peewee import IntegrityError
+
 from skirmserv.models.user import UserModel
 from skirmserv.api import requires_auth
 
@@ -47,9 +49,13 @@ class UserAPI(Resource):
         if existing_user is not None:
             abort(409, message="Email Adress already in use!")
 
-        user = UserModel.register(
-            args.get("name"), args.get("email"), args.get("password")
-        )
+        # The email may be registered in the meantime by another request
+        try:
+            user = UserModel.register(
+                args.get("name"), args.get("email"), args.get("password")
+            )
+        except IntegrityError:
+            abort(409, message="Email Adress already in use!")
 
         access_token = user.generate_access_token()
 
@@ -11,10 +11,11 @@ if TYPE_CHECKING:
     from skirmserv.models.user import UserModel
 
 from flask import request
+from flask import current_app
 from flask_socketio import SocketIO  # Just for typing
-import json
 
 import time
+from collections import deque
 
 from logging import getLogger
 
@@ -23,6 +24,15 @@ from skirmserv.game.game import Game
 from skirmserv.game.team import Team
 from skirmserv.game.game_manager import GameManager
 
+from skirmserv.communication.encoding import get_encoding
+from skirmserv.communication.outbound import OutboundQueue
+
+from skirmserv.util.serializer import lazy_dumps
+from skirmserv.util.stats import percentiles
+from skirmserv.util.batch import batch_updates
+from skirmserv.util.batch import defer_update
+from skirmserv.util.batch import pop_deferred_update
+
 
 class SocketClient(object):
     # Action codes
@@ -47,12 +57,56 @@ class SocketClient(object):
     ACTION_HP_GOT_HIT = 18
     ACTION_HP_HIT_VALID = 19
 
+    # Actions handled when sent by the client. Key is the action code, value
+    # the name of the handler method and the fields (with their type) that
+    # are required by it. Actions with missing or invalid fields are ignored
+    ACTION_HANDLERS = {
+        ACTION_JOIN_GAME: ("_on_join_game", {}),
+        ACTION_LEAVE_GAME: ("_on_leave_game", {}),
+        ACTION_GOT_HIT: ("_on_got_hit", {"pid": int, "sid": int}),
+        ACTION_SEND_SHOT: ("_on_send_shot", {"sid": int}),
+        ACTION_FULL_DATA_UPDATE: ("_on_full_data_update", {}),
+        ACTION_TIMESYNC: ("_on_timesync", {}),
+        ACTION_HP_GOT_HIT: (
+            "_on_hp_got_hit",
+            {"hpmode": int, "pid": int, "sid": int},
+        ),
+    }
+
+    # Fields containing timestamps, they are sent in the time of the clients
+    # clock (0 is sent unchanged, it means not set)
+    TIMESTAMP_FIELDS = ("p_pdu", "p_iu", "g_st", "g_ca")
+
     def __init__(self, socket_id: str, user: UserModel, socketio: SocketIO):
         self.socket_id = socket_id
         self.user = user
         self.socketio = socketio
 
+        # Wire format negotiated when joining the server
+        self.encoding = get_encoding("json")
+
+        # Messages are numbered, the last ones are kept to send them again if
+        # the client rejoins after a lost connection (see replay)
+        self.seq = 0
+        self.replay_buffer = deque(maxlen=int(current_app.config["REPLAY_BUFFER_SIZE"]))
+
+        # Messages are queued if the client does not keep up
+        self.outbound = OutboundQueue(
+            self,
+            int(current_app.config["CLIENT_QUEUE_SIZE"]),
+            int(current_app.config["CLIENT_MAX_IN_FLIGHT"]),
+        )
+
+        # Offset of the clients clock to the server clock and the last round
+        # trip time in seconds, measured by timesync (see _on_timesync)
+        self.clock_offset = 0
+        self.rtt = None
+        self.rtt_samples = deque(maxlen=100)
+        self._timesync_samples = []  # (rtt, offset) of the running timesync
+
         self.connection_closed = 0
+        # Time of the last message (e.g. keep alive) received from the client
+        self.last_seen = time.time()
 
         self.current_actions = set()
         self.current_data = {}
@@ -65,6 +119,9 @@ class SocketClient(object):
         # get the difference and send only changed fields (except some
         # fields that are always set)
         self.last_sent_pgt_data = {}
+        # Dict to store the pgt versions of the player/game/team objects
+        # at the last update. Used to collect only fields changed since then
+        self.last_sent_pgt_versions = {}
 
     def reset(self) -> None:
         """Resets this client to initial state"""
@@ -72,9 +129,14 @@ class SocketClient(object):
         if self.game is not None:
             self._on_leave_game(None)
 
+        # Send a deferred update before the triggered actions are cleared
+        self.flush_update()
+
         self.current_actions = set()
         self.current_data = {}
         self.last_sent_pgt_data = {}
+        self.last_sent_pgt_versions = {}
+        self.replay_buffer.clear()
         self.game = None
         self.player = None
         self.connection_closed = 0
@@ -115,6 +177,14 @@ class SocketClient(object):
         """Triggers the given action on the client with the given parameters.
         The parameter are not checked on server side. The trigger is send when
         client.update is called the next time"""
+
+        # Parameters can only be sent once per update, if another action
+        # already uses them, its deferred update is sent first
+        for key in param:
+            if key in self.current_data and self.current_data[key] != param[key]:
+                self.flush_update()
+                break
+
         self.current_actions.add(code)
         self.current_data.update(param)
         getLogger(__name__).debug("Triggered action %d on client %s", code, str(self))
@@ -124,6 +194,20 @@ class SocketClient(object):
         self.current_data.update(field_data)
 
     def update(self, full=False):
+        """Sends this client a update with all triggered actions and data.
+        Within batch_updates the update is sent once at the end of the batch"""
+        if defer_update(self, full):
+            return
+
+        self._send_update(full)
+
+    def flush_update(self) -> None:
+        """Sends the update deferred by the current batch now"""
+        full = pop_deferred_update(self)
+        if full is not None:
+            self._send_update(full)
+
+    def _send_update(self, full=False):
         """Sends this client a update with all triggered actions and data"""
 
         # Create data object with actions
@@ -131,86 +215,139 @@ class SocketClient(object):
         # and add (parameter) data
         data.update(self.current_data)
 
-        # Create pgt data (player/game/team)
-        new_pgt = {}
-
-        # Add fields from player object if available
+        # Objects providing pgt data (player/game/team)
+        sources = []
         if self.player is not None:
-            new_pgt.update(self.player.get_pgt_data())
-            # Add fields from team object if available
+            sources.append(self.player)
             if self.player.team is not None:
-                # TODO: implement team data
-                new_pgt.update(self.player.team.get_pgt_data())
-
-        # Add fields from game object if available
+                sources.append(self.player.team)
         if self.game is not None:
-            new_pgt.update(self.game.get_pgt_data())
+            sources.append(self.game)
+
+        # Versions of the sources after this update
+        new_versions = {source: source.pgt_version for source in sources}
+
+        # If full data is requested
+        if full:
+            # Set last sent data that diff works next time
+            self.last_sent_pgt_data = {}
+            for source in sources:
+                self.last_sent_pgt_data.update(source.get_pgt_data())
+            # update data with all fields
+            data.update(self.last_sent_pgt_data)
 
         # if not full data is requested
-        if not full:
-            # get difference between last and new pgt data
-            pgt_diff = {}
+        else:
+            for source in sources:
+                last_version = self.last_sent_pgt_versions.get(source, None)
 
-            # Todo: This is probably more elegant possible
-            for key in new_pgt:
-                old_value = self.last_sent_pgt_data.get(key, None)
-                new_value = new_pgt.get(key, None)
-                if old_value != new_value:
-                    pgt_diff.update({key: new_value})
+                # Send all fields of sources not sent before (e.g. a new team)
+                if last_version is None:
+                    pgt_diff = source.get_pgt_data()
 
-            self.last_sent_pgt_data = new_pgt
+                # Else only the fields changed since the last update, which
+                # are also different to the last sent value
+                else:
+                    pgt_diff = {}
+                    changes = source.get_pgt_changes(last_version)
+                    for key, value in changes.items():
+                        if self.last_sent_pgt_data.get(key, None) != value:
+                            pgt_diff.update({key: value})
 
-            # Update data (which will be send) with all changed fields
-            data.update(pgt_diff)
+                self.last_sent_pgt_data.update(pgt_diff)
 
-        # If full data is requested
-        else:
-            # Set last sent data that diff works next time
-            self.last_sent_pgt_data = new_pgt
-            # update data with all fields
-            data.update(new_pgt)
+                # Update data (which will be send) with all changed fields
+                data.update(pgt_diff)
+
+        self.last_sent_pgt_versions = new_versions
 
         # Clear current actions and (param) data
         self.current_actions.clear()
         self.current_data.clear()
 
+        # Correct the timestamps by the offset of the clients clock
+        if self.clock_offset != 0:
+            for key in SocketClient.TIMESTAMP_FIELDS:
+                if data.get(key, 0) != 0:
+                    data.update({key: int(data[key] + self.clock_offset)})
+
         # Send data to the socket (but only if its not empty data)
         if data != {"a": []}:
+            self.seq += 1
+            data.update({"seq": self.seq})
+            self.replay_buffer.append(data)
             self.send(data)
 
         getLogger(__name__).debug("Updated data for client %s", str(self))
 
+    def can_replay(self, seq: int) -> bool:
+        """Returns True if all messages after the given sequence number are
+        still stored in the replay buffer"""
+        if seq > self.seq or seq < 0:
+            return False
+        if seq == self.seq:
+            return True
+        return len(self.replay_buffer) > 0 and self.replay_buffer[0]["seq"] <= seq + 1
+
+    def replay(self, seq: int) -> None:
+        """Sends again all messages after the given sequence number (only
+        possible if can_replay is True)"""
+        for data in self.replay_buffer:
+            if data["seq"] > seq:
+                self.send(data)
+
+        getLogger(__name__).debug(
+            "Replayed messages %d to %d for client %s", seq + 1, self.seq, self
+        )
+
     def send(self, data: dict, event="message") -> None:
         """Sends the given data dictionary (in skirmish format) to the client"""
         if self.socket_id is not None:
-            data = json.dumps(data)
-            self.socketio.emit(event, data, to=self.socket_id)
+            self.outbound.put(data, event)
 
-    def on_receive(self, data: dict) -> None:
+    def on_receive(self, data: dict | list) -> None:
         """Should be called when from this client some data is received on the
-        message event."""
-
-        # Protocol requires that "a" is always given but just using an empty
-        # list of actions when there is not field "a" in the received data
-        actions = data.get("a", [])
-
-        for action in actions:
-            if action == SocketClient.ACTION_JOIN_GAME:
-                self._on_join_game(data)
-            elif action == SocketClient.ACTION_LEAVE_GAME:
-                self._on_leave_game(data)
-            elif action == SocketClient.ACTION_GOT_HIT:
-                self._on_got_hit(data)
-            elif action == SocketClient.ACTION_SEND_SHOT:
-                self._on_send_shot(data)
-            elif action == SocketClient.ACTION_FULL_DATA_UPDATE:
-                self.update(full=True)
-            elif action == SocketClient.ACTION_HP_GOT_HIT:
-                self._on_hp_got_hit(data)
+        message event. The data may also be a list of messages (e.g. multiple
+        hits detected at once), they are handled as one batch."""
 
-        getLogger(__name__).debug(
-            "Client %s received data: %s", str(self), json.dumps(data)
-        )
+        messages = data if type(data) == list else [data]
+
+        # Every message (keep alive or any other action) shows that the
+        # client is still alive
+        self.last_seen = time.time()
+
+        # Every affected client gets a single update for all messages
+        with batch_updates():
+            for message in messages:
+                if type(message) != dict:
+                    continue
+
+                # Protocol requires that "a" is always given but just using an
+                # empty list of actions when there is no field "a" in the data
+                for action in message.get("a", []):
+                    self._handle_action(action, message)
+
+        getLogger(__name__).debug("Client %s received data: %s", self, lazy_dumps(data))
+
+    def _handle_action(self, action: int, data: dict) -> None:
+        """Calls the handler of the given action if all required fields are
+        given in the data"""
+        handler = SocketClient.ACTION_HANDLERS.get(action, None)
+        if handler is None:
+            return
+
+        method, fields = handler
+        for field, field_type in fields.items():
+            if not isinstance(data.get(field, None), field_type):
+                getLogger(__name__).debug(
+                    "Client %s sent action %d with invalid field %s",
+                    self,
+                    action,
+                    field,
+                )
+                return
+
+        getattr(self, method)(data)
 
     def _on_join_game(self, data):
         """Join Game Event triggered by client"""
@@ -244,39 +381,105 @@ class SocketClient(object):
     def _on_got_hit(self, data):
         """Got Hit Event triggered by client"""
         if self.player is not None:
-            # Get pid and sid fields
-            pid = data.get("pid", None)
-            sid = data.get("sid", None)
-            hp = data.get("hp", None)
-
-            # do not act on missing fields
-            if pid is None or sid is None:
-                return
+            # Hitpoint (phaser, chest, ...), undefined if not given
+            hp = data.get("hp", 7)
+            if type(hp) != int or hp < 0 or hp > 7:
+                hp = 7
 
             # Trigger got_hit method from associated player
-            self.player.got_hit(pid, sid, hp)
+            self.player.got_hit(data["pid"], data["sid"], hp)
 
     def _on_send_shot(self, data):
         """Send Shot event triggered by client"""
         if self.player is not None:
-            # Get sid field
-            sid = data.get("sid", None)
+            # Trigger send_shot method from associated player
+            self.player.send_shot(data["sid"])
+
+    def _on_full_data_update(self, data):
+        """Full data update requested by the client"""
+        self.update(full=True)
+
+    def _on_timesync(self, data):
+        """Timesync event triggered by the client. Without fields a new
+        timesync is started: the server sends its time (ts) and the client
+        echoes it together with its own time (tc), both in milliseconds.
+
+        Every echo is a sample of the round trip time and the clock offset.
+        After TIMESYNC_SAMPLES samples the offset of the sample with the lowest
+        round trip time is used (like NTP does), until then the server sends
+        a new request after every echo."""
+        received = time.time()
+
+        ts = data.get("ts", None)
+        tc = data.get("tc", None)
+
+        # Start a new timesync
+        if ts is None or tc is None:
+            self._timesync_samples = []
+            self._send_timesync()
+            return
 
-            # do not act on missing field
-            if sid is None:
-                return
+        if not isinstance(ts, (int, float)) or not isinstance(tc, (int, float)):
+            return
 
-            # Trigger send_shot method from associated player
-            self.player.send_shot(sid)
+        # Ignore echos of requests never sent
+        rtt = received - ts / 1000
+        if rtt < 0:
+            return
+
+        # The client time is assumed to be taken in the middle of the trip
+        offset = tc / 1000 - (ts / 1000 + received) / 2
+
+        self.rtt = rtt
+        self.rtt_samples.append(rtt)
+        self._timesync_samples.append((rtt, offset))
+
+        if len(self._timesync_samples) < int(current_app.config["TIMESYNC_SAMPLES"]):
+            self._send_timesync()
+            return
+
+        old_offset = self.clock_offset
+        rtt, self.clock_offset = min(self._timesync_samples)
+        self._timesync_samples = []
+
+        getLogger(__name__).debug(
+            "Client %s synced clock: offset %.3fs, rtt %.3fs",
+            self,
+            self.clock_offset,
+            rtt,
+        )
+
+        # Send the timestamps again if they changed by the new offset
+        if round(old_offset) != round(self.clock_offset):
+            self.update(full=True)
+
+    def _send_timesync(self) -> None:
+        """Sends a timesync request with the current server time. Emitted
+        directly on the socket (not queued like the updates), the time spent
+        in the outbound queue must not count as round trip time"""
+        if self.socket_id is None:
+            return
+
+        data = {"a": [SocketClient.ACTION_TIMESYNC], "ts": int(time.time() * 1000)}
+        self.socketio.emit("message", self.encoding.encode(data), to=self.socket_id)
+
+    def get_queue_stats(self) -> dict:
+        """Returns the depth and the counters of the outbound queue"""
+        return self.outbound.get_stats()
+
+    def get_rtt_percentiles(self) -> dict:
+        """Returns percentiles of the recent round trip times in seconds"""
+        return percentiles(self.rtt_samples)
 
     def _on_hp_got_hit(self, data):
         """Hitpoint got hit event triggered by client"""
-        mode = data.get("hpmode", None)
-        pid = data.get("pid", None)
-        sid = data.get("sid", None)
-        if mode is None or pid is None or sid is None:
+        if self.game is None:
             return
 
+        mode = data["hpmode"]
+        pid = data["pid"]
+        sid = data["sid"]
+
         player = self.game.get_player_by_pid(pid)
         if player is None:
             return
@@ -292,6 +495,17 @@ class SocketClient(object):
             )
             self.update()
 
+    def is_idle(self, timeout: float, now: float = None) -> bool:
+        """Returns True if the connection of this client is closed for more
+        than timeout seconds or nothing was received for more than timeout
+        seconds (not even keep alive messages)"""
+        if now is None:
+            now = time.time()
+
+        if self.connection_closed > 0:
+            return now - self.connection_closed > timeout
+        return now - self.last_seen > timeout
+
     def close(self):
         """Called when the websocket connection was closed"""
         self.connection_closed = time.time()
@@ -6,6 +6,7 @@ Copyright (C) 2022 Ole Lange
 
 from skirmserv.communication import SocketClient
 from skirmserv.communication.spectator import Spectator
+from skirmserv.communication.encoding import get_encoding
 from skirmserv.models.user import UserModel
 
 from skirmserv.game.game_manager import GameManager
@@ -15,7 +16,6 @@ from flask import current_app
 from flask_socketio import SocketIO
 
 import time
-import json
 from logging import getLogger
 
 
@@ -40,8 +40,15 @@ class ClientManager(object):
 
         self.socketio = None
         self.clients = {}  # key is socket_id, value is socketclient object
+        self.clients_by_user = {}  # key is user id, value is socketclient object
         self.spectators = {}  # key is socket_id, value is spectator object
 
+        # Idle clients are removed by the reaper (see start_reaper)
+        self.app = None
+        self.idle_timeout = 600
+        self.reaped_clients = 0  # Total count of removed clients
+        self.reaped_players = 0  # Total count of players removed from games
+
     # Singleton Wrapper methods
     @staticmethod
     def get_client(socket_id):
@@ -54,69 +61,104 @@ class ClientManager(object):
         return ClientManager.get_instance()._set_socketio(socketio)
 
     @staticmethod
-    def join_client(access_token: str, socket_id: str) -> SocketClient:
+    def join_client(
+        access_token: str,
+        socket_id: str,
+        encoding: str = "json",
+        seq: int = None,
+        ack: bool = False,
+    ) -> SocketClient:
         """Creates a new SocketClient object and stores it. If there is already
         a client with the given access token from another socket, the socket is
-        replaced with the new one."""
-        return ClientManager.get_instance()._join_client(access_token, socket_id)
+        replaced with the new one. Messages to the client are sent in the given
+        encoding (if available). A rejoining client gets the messages after
+        the given sequence number (the last one it received) or, if they are
+        not available anymore, a full data update. Clients acknowledging the
+        received messages (ack) get no more messages than they keep up with
+        (see OutboundQueue)."""
+        return ClientManager.get_instance()._join_client(
+            access_token, socket_id, encoding, seq, ack
+        )
 
     @staticmethod
-    def join_spectator(socket_id: str, gid: str) -> Spectator:
-        """Creates a new Spectator object for the given game and stores it."""
-        return ClientManager.get_instance()._join_spectator(socket_id, gid)
+    def join_spectator(socket_id: str, gid: str, delta=False) -> Spectator:
+        """Creates a new Spectator object for the given game and stores it.
+        Spectators in delta mode receive only changed fields after the first
+        snapshot."""
+        return ClientManager.get_instance()._join_spectator(socket_id, gid, delta)
 
     @staticmethod
     def get_spectator(socket_id: str) -> Spectator:
         """Returns the spectator object from this socket"""
         return ClientManager.get_instance()._get_spectator(socket_id)
 
+    @staticmethod
+    def start_reaper() -> None:
+        """Starts the background task removing idle clients. Has to be called
+        within the app context, the timeout and the interval are read from
+        the config"""
+        return ClientManager.get_instance()._start_reaper()
+
+    @staticmethod
+    def reap_clients() -> dict:
+        """Removes all idle clients (see SocketClient.is_idle) and their
+        players from the games. Returns the count of removed clients and
+        players."""
+        return ClientManager.get_instance()._reap_clients()
+
     # Singleton Wrapper wrapped methods
     def _get_client(self, socket_id):
         """Returns the client associated with this socket."""
         return self.clients.get(socket_id, None)
 
-    def _join_client(self, access_token: str, socket_id: str) -> SocketClient:
+    def _join_client(
+        self,
+        access_token: str,
+        socket_id: str,
+        encoding: str = "json",
+        seq=None,
+        ack=False,
+    ) -> SocketClient:
         """Creates a new SocketClient object and stores it. If there is already
         a client with the given access token from another socket, the socket is
-        replaced with the new one."""
+        replaced with the new one. Messages to the client are sent in the given
+        encoding (if available). A rejoining client gets the messages after
+        the given sequence number or a full data update."""
 
         user = UserModel.authenticate_by_token(access_token)
         if user is None:
             return
 
-        # Check if there is already a client with the given access_token.
-        # If so, the old socket id is stored.
-        old_socket_id = None
-        for existing_socket_id in self.clients:
-            client = self.clients[existing_socket_id]
-
-            # If there is already a client from another socket from this user
-            if client.user.id == user.id:
-                old_socket_id = existing_socket_id
-                break
-
-            # If there is a connection from this socket from other user
-            if existing_socket_id == socket_id:
-                # delete the existing client and create a new one later on
-                del client
+        # If there is a connection from this socket from another user, the
+        # socket is taken away from the client of the other user
+        current_client = self.clients.get(socket_id, None)
+        if current_client is not None and current_client.user.id != user.id:
+            self._detach_client(current_client)
 
         # Replace if there is a old connection and return the client object
-        if old_socket_id is not None:
-            old_client = self.clients[old_socket_id]
-            # if the last disconnect event was more than 10 minutes ago
-            # the client will be reset
-            if (
-                old_client.connection_closed > 0
-                and time.time() - old_client.connection_closed > 600
+        old_client = self.clients_by_user.get(user.id, None)
+        if old_client is not None:
+            # if the last disconnect event was more than CLIENT_IDLE_TIMEOUT
+            # seconds ago the client will be reset
+            if old_client.connection_closed > 0 and old_client.is_idle(
+                self.idle_timeout
             ):
                 old_client.reset()
+            self._detach_client(old_client)
             old_client.connection_closed = 0
+            old_client.last_seen = time.time()
             old_client.socket_id = socket_id
-            self.clients.pop(old_socket_id)
+            old_client.encoding = get_encoding(encoding)
+            old_client.outbound.connect(ack)
             self.clients.update({socket_id: old_client})
 
-            # Sending full data to the client if currently ingame
-            if old_client.game is not None:
+            # Sending the missed messages if they are still available
+            if seq is not None and old_client.can_replay(seq):
+                old_client.replay(seq)
+                old_client.update()
+
+            # else sending full data to the client if currently ingame
+            elif old_client.game is not None:
                 old_client.trigger_action(SocketClient.ACTION_FULL_DATA_UPDATE)
                 old_client.update(full=True)
 
@@ -126,11 +168,84 @@ class ClientManager(object):
 
         # Else create a new SocketClient object, store it and return it
         new_client = SocketClient(socket_id, user, self.socketio)
+        new_client.encoding = get_encoding(encoding)
+        new_client.outbound.connect(ack)
         self.clients.update({socket_id: new_client})
+        self.clients_by_user.update({user.id: new_client})
         getLogger(__name__).info("Joined client: %s", str(new_client))
         return new_client
 
-    def _join_spectator(self, socket_id: str, gid: str) -> Spectator:
+    def _detach_client(self, client: SocketClient) -> None:
+        """Removes the socket from the given client. The client is kept (and
+        can rejoin) until it is removed by the reaper"""
+        if self.clients.get(client.socket_id, None) is client:
+            self.clients.pop(client.socket_id)
+
+        if client.connection_closed == 0:
+            client.close()
+        client.socket_id = None
+
+    def _remove_client(self, client: SocketClient) -> None:
+        """Removes the given client from the indexes"""
+        self._detach_client(client)
+        if self.clients_by_user.get(client.user.id, None) is client:
+            self.clients_by_user.pop(client.user.id)
+
+    def _start_reaper(self) -> None:
+        """Starts the background task removing idle clients"""
+        self.app = current_app._get_current_object()
+        self.idle_timeout = float(current_app.config["CLIENT_IDLE_TIMEOUT"])
+        interval = float(current_app.config["CLIENT_REAP_INTERVAL"])
+
+        if interval > 0:
+            self.socketio.start_background_task(self._reaper_loop, interval)
+
+    def _reaper_loop(self, interval: float) -> None:
+        """Removes idle clients every interval seconds"""
+        while True:
+            self.socketio.sleep(interval)
+            try:
+                with self.app.app_context():
+                    self._reap_clients()
+            except Exception:
+                getLogger(__name__).exception("Removing idle clients failed")
+
+    def _reap_clients(self) -> dict:
+        """Removes all idle clients and their players from the games"""
+        now = time.time()
+        idle = [
+            client
+            for client in self.clients_by_user.values()
+            if client.is_idle(self.idle_timeout, now)
+        ]
+
+        players = 0
+        for client in idle:
+            # Disconnect clients that are still connected but do not send
+            # anything
+            if client.connection_closed == 0 and client.socket_id is not None:
+                self.socketio.server.disconnect(client.socket_id, namespace="/")
+
+            # Nothing is sent to the removed client anymore
+            self._remove_client(client)
+            if client.game is not None:
+                players += 1
+            client.reset()
+
+        self.reaped_clients += len(idle)
+        self.reaped_players += players
+
+        if len(idle) > 0:
+            getLogger(__name__).info(
+                "Removed %d idle clients (%d players), %d clients left",
+                len(idle),
+                players,
+                len(self.clients_by_user),
+            )
+
+        return {"clients": len(idle), "players": players}
+
+    def _join_spectator(self, socket_id: str, gid: str, delta=False) -> Spectator:
         game = GameManager.get_game(gid)
 
         current_spectator = self.spectators.get(socket_id, None)
@@ -138,7 +253,7 @@ class ClientManager(object):
             current_spectator.close()
 
         if game is not None:
-            spectator = Spectator(socket_id, game, self.socketio)
+            spectator = Spectator(socket_id, game, self.socketio, delta)
             self.spectators.update({socket_id: spectator})
 
             getLogger(__name__).info("Joined spectator: %s", str(spectator))
@@ -158,31 +273,54 @@ class ClientManager(object):
             # Get access_token & socketid
             socket_id = request.sid
             access_token = data.get("access_token", None)
+            encoding = data.get("encoding", None)
+            seq = data.get("seq", None)
+            ack = data.get("ack", False) is True
 
             # Do nothing on invalid requests
             if socket_id is None or access_token is None:
                 return
 
-            client = ClientManager.join_client(access_token, socket_id)
+            # The sequence number of the last received message is only sent
+            # when rejoining
+            if type(seq) != int:
+                seq = None
+
+            client = ClientManager.join_client(
+                access_token, socket_id, encoding or "json", seq, ack
+            )
 
             if client is not None:
-                # Sending "joined server" event
-                client.trigger_action(client.ACTION_JOINED_SERVER)
+                # Sending "joined server" event, including the used encoding
+                # if the client requested one
+                if encoding is not None:
+                    client.trigger_action(
+                        client.ACTION_JOINED_SERVER, enc=client.encoding.name
+                    )
+                else:
+                    client.trigger_action(client.ACTION_JOINED_SERVER)
                 client.update()
             else:
                 # Sending "join denied" event
-                data = json.dumps({"a": [SocketClient.ACTION_SERVER_JOIN_DENIED]})
+                data = get_encoding(encoding).encode(
+                    {"a": [SocketClient.ACTION_SERVER_JOIN_DENIED]}
+                )
                 self.socketio.emit("message", data, to=socket_id)
 
         # Callback for messages on "message" event
         def socketio_message(data: dict) -> None:
-            # Only act when received data is json
-            if type(data) != dict:
-                return
-
             # Get client by socket id
             client = ClientManager.get_client(request.sid)
 
+            # Decode the received data in the encoding used by the client
+            if client is not None:
+                data = client.encoding.decode(data)
+
+            # Only act when received data is a message object (or a list of
+            # message objects)
+            if type(data) != dict and type(data) != list:
+                return
+
             # If the client is existing, call the receive function of the
             # specific client with the received data.
             if client is not None:
@@ -193,8 +331,10 @@ class ClientManager(object):
             socket_id = request.sid
             gid = data.get("gid", None)
             close = data.get("close", None)
+            resync = data.get("resync", None)
+            delta = data.get("delta", False)
 
-            if socket_id is None or (gid is None and close is None):
+            if socket_id is None or (gid is None and close is None and resync is None):
                 return
 
             spectator = ClientManager.get_spectator(socket_id)
@@ -202,8 +342,12 @@ class ClientManager(object):
             if close is not None and spectator is not None:
                 spectator.close()
 
+            # Send a new snapshot if requested
+            if resync is not None and spectator is not None:
+                spectator.update()
+
             if gid is not None:
-                spectator = ClientManager.join_spectator(socket_id, gid)
+                spectator = ClientManager.join_spectator(socket_id, gid, delta)
 
         # Callback for disconnect socket event
         def on_socket_disconnect() -> None:
@@ -211,7 +355,7 @@ class ClientManager(object):
 
             client = ClientManager.get_client(sid)
             if client is not None:
-                client.close()
+                ClientManager.get_instance()._detach_client(client)
 
             spectator = ClientManager.get_spectator(sid)
             if spectator is not None:
@@ -0,0 +1,141 @@
+"""
+Skirmish Server
+
+Wire formats of the messages exchanged with the phasers. JSON is the default,
+the compact MessagePack format (integer field ids instead of the string keys)
+can be requested by the phaser when joining the server. It is only available
+if the msgpack package is installed. MessagePack messages are about a third
+of the size of JSON messages, but encoding them takes longer than encoding
+JSON with orjson (see benchmarks/wire_format.py).
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.util import serializer
+
+from logging import getLogger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Integer ids of the fields used by the compact format. Never change or reuse
+# an id, only append new ones. Fields without an id are sent by their name.
+FIELD_IDS = {
+    # Actions and action parameters
+    "a": 0,
+    "gid": 1,
+    "pid": 2,
+    "sid": 3,
+    "hp": 4,
+    "hpmode": 5,
+    "cooldown": 6,
+    "color_r": 7,
+    "color_g": 8,
+    "color_b": 9,
+    "amount": 10,
+    "name": 11,
+    "enc": 12,
+    "ts": 13,
+    "tc": 14,
+    "seq": 15,
+    # Player
+    "p_id": 20,
+    "p_n": 21,
+    "p_h": 22,
+    "p_p": 23,
+    "p_cr": 24,
+    "p_cg": 25,
+    "p_cb": 26,
+    "p_cbg": 27,
+    "p_al": 28,
+    "p_a": 29,
+    "p_pe": 30,
+    "p_pdu": 31,
+    "p_msi": 32,
+    "p_r": 33,
+    "p_i": 34,
+    "p_iu": 35,
+    "p_ilo": 36,
+    # Team
+    "t_id": 50,
+    "t_pc": 51,
+    "t_p": 52,
+    "t_r": 53,
+    "t_n": 54,
+    # Game
+    "g_id": 70,
+    "g_pc": 71,
+    "g_tc": 72,
+    "g_st": 73,
+    "g_ca": 74,
+    "g_cb": 75,
+}
+
+FIELD_NAMES = {field_id: name for name, field_id in FIELD_IDS.items()}
+
+
+class JSONEncoding(object):
+    """Default encoding, messages are sent as JSON strings"""
+
+    name = "json"
+
+    def encode(self, data: dict) -> str:
+        """Encodes the given message"""
+        return serializer.dumps(data)
+
+    def decode(self, raw) -> dict | list:
+        """Decodes the given message, socket.io already decodes JSON"""
+        return raw
+
+
+class MsgpackEncoding(object):
+    """Compact encoding, messages are sent as binary MessagePack maps using
+    the integer field ids as keys"""
+
+    name = "msgpack"
+
+    def encode(self, data: dict) -> bytes:
+        """Encodes the given message"""
+        return msgpack.packb({FIELD_IDS.get(k, k): v for k, v in data.items()})
+
+    def decode(self, raw) -> dict | list | None:
+        """Decodes the given message (or list of messages). Messages that are
+        already decoded (like JSON messages) are returned unchanged. Returns
+        None if the message is malformed"""
+        if not isinstance(raw, (bytes, bytearray)):
+            return raw
+
+        try:
+            data = msgpack.unpackb(raw, strict_map_key=False)
+        except (msgpack.UnpackException, ValueError, TypeError):
+            getLogger(__name__).debug("Received malformed msgpack message")
+            return None
+
+        if type(data) == list:
+            return [self._decode_message(message) for message in data]
+
+        return self._decode_message(data)
+
+    def _decode_message(self, data) -> dict:
+        """Replaces the field ids of the given message by their names"""
+        if type(data) != dict:
+            return None
+
+        return {FIELD_NAMES.get(k, k): v for k, v in data.items()}
+
+
+# Dict containing all available encodings with their names as key
+available_encodings = {"json": JSONEncoding()}
+if msgpack is not None:
+    available_encodings.update({"msgpack": MsgpackEncoding()})
+
+
+def get_encoding(name: str):
+    """Returns the encoding with the given name or the default encoding if it
+    is not available"""
+    if not isinstance(name, str):
+        return available_encodings["json"]
+    return available_encodings.get(name, available_encodings["json"])
@@ -0,0 +1,184 @@
+"""
+Skirmish Server
+
+Outbound queue of a client. Messages are emitted directly as long as the
+client keeps up. Phasers that acknowledge the received messages (joined with
+"ack": true) have at most CLIENT_MAX_IN_FLIGHT unacknowledged messages, the
+following messages are queued and sent by a background task when the phaser
+acknowledged the previous ones. So a slow client (e.g. a phaser on a bad
+connection) does not slow down the other clients of the game. Messages to
+phasers that do not acknowledge are always emitted directly.
+
+If the queue is full, a new message is merged into the last queued message
+if nothing is lost by it: the newer pgt fields (and sequence number) replace
+the queued ones and the actions are appended, if the parameters of the
+actions do not conflict. Otherwise the client is disconnected, the queued
+messages are sent again by replaying them when the phaser rejoins.
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from skirmserv.communication.client import SocketClient
+
+from collections import deque
+
+from logging import getLogger
+
+
+class OutboundQueue(object):
+    # Prefixes of the player/game/team fields
+    PGT_PREFIXES = ("p_", "t_", "g_")
+
+    # Seconds to wait until the client is checked again if it is backed up
+    DRAIN_INTERVAL = 0.05
+
+    def __init__(self, client: SocketClient, size: int, max_in_flight: int):
+        self.client = client
+        self.size = size  # Max. count of queued messages
+        self.max_in_flight = max_in_flight  # Max. unacknowledged messages
+
+        self.ack = False  # If the client acknowledges the messages
+        self.in_flight = 0  # Messages sent but not acknowledged yet
+        self.connection = 0  # Counted up on every (re)connection
+
+        self.queue = deque()  # (event, data) tuples
+        self.draining = False
+
+        self.sent_count = 0
+        self.acked_count = 0
+        self.coalesced_count = 0  # Messages merged into queued messages
+        self.overflow_count = 0  # Disconnects because the queue was full
+
+    def connect(self, ack: bool = False) -> None:
+        """Called when the client (re)joined with a new socket. Messages
+        queued for the previous socket are dropped (they are replayed on
+        rejoin) and acknowledgements for them are ignored"""
+        self.connection += 1
+        self.ack = ack
+        self.in_flight = 0
+        self.queue.clear()
+
+    def put(self, data: dict, event="message") -> None:
+        """Sends the given message or queues it if the client is backed up"""
+        if len(self.queue) == 0 and not self.is_backed_up():
+            self._emit(event, data)
+            return
+
+        if len(self.queue) < self.size:
+            self.queue.append((event, data))
+        elif not self._coalesce(event, data):
+            self._overflow()
+            return
+
+        if not self.draining:
+            self.draining = True
+            self.client.socketio.start_background_task(self._drain)
+
+    def get_depth(self) -> int:
+        """Returns the count of queued messages"""
+        return len(self.queue)
+
+    def get_stats(self) -> dict:
+        """Returns the queue depth and the counters of this queue"""
+        return {
+            "depth": len(self.queue),
+            "in_flight": self.in_flight,
+            "sent": self.sent_count,
+            "acked": self.acked_count,
+            "coalesced": self.coalesced_count,
+            "overflows": self.overflow_count,
+        }
+
+    def is_backed_up(self) -> bool:
+        """Returns True if max_in_flight messages are not acknowledged by the
+        client yet. Clients not acknowledging messages are never backed up"""
+        return self.ack and self.in_flight >= self.max_in_flight
+
+    def _coalesce(self, event: str, data: dict) -> bool:
+        """Merges the given message into the last queued message if nothing
+        is lost by it. Returns False if the message can not be merged. The
+        queued message is replaced by a merged copy (it may still be
+        referenced, e.g. by the replay buffer of the client)"""
+        last_event, last_data = self.queue[-1]
+        if last_event != event:
+            return False
+
+        for key, value in data.items():
+            # Newer player/game/team fields and the newer sequence number
+            # replace the queued ones, parameters of actions must not differ
+            if key == "a" or key == "seq" or key.startswith(self.PGT_PREFIXES):
+                continue
+            if key in last_data and last_data[key] != value:
+                return False
+
+        merged = dict(last_data)
+        merged.update(data)
+        merged.update({"a": list(last_data.get("a", [])) + list(data.get("a", []))})
+
+        self.queue[-1] = (last_event, merged)
+        self.coalesced_count += 1
+        return True
+
+    def _overflow(self) -> None:
+        """Disconnects the client, its queue is full and the message can not
+        be merged. The rejoining phaser gets the missed messages replayed (or
+        a full data update)"""
+        self.overflow_count += 1
+        self.queue.clear()
+
+        getLogger(__name__).warning(
+            "Outbound queue of client %s overflowed, disconnecting", self.client
+        )
+        if self.client.socket_id is not None:
+            self.client.socketio.server.disconnect(self.client.socket_id, namespace="/")
+
+    def _drain(self) -> None:
+        """Sends the queued messages as fast as the client acknowledges
+        them"""
+        try:
+            while len(self.queue) > 0:
+                if self.client.socket_id is None:
+                    self.queue.clear()
+                    break
+
+                if self.is_backed_up():
+                    self.client.socketio.sleep(OutboundQueue.DRAIN_INTERVAL)
+                    continue
+
+                event, data = self.queue.popleft()
+                self._emit(event, data)
+
+                # Let the other tasks run between the messages
+                self.client.socketio.sleep(0)
+        finally:
+            self.draining = False
+
+    def _emit(self, event: str, data: dict) -> None:
+        """Emits the given message to the socket of the client"""
+        data = self.client.encoding.encode(data)
+
+        if self.ack:
+            self.in_flight += 1
+            connection = self.connection
+            self.client.socketio.emit(
+                event,
+                data,
+                to=self.client.socket_id,
+                callback=lambda *args: self._acknowledged(connection),
+            )
+        else:
+            self.client.socketio.emit(event, data, to=self.client.socket_id)
+
+        self.sent_count += 1
+
+    def _acknowledged(self, connection: int) -> None:
+        """Called when the client acknowledged a message"""
+        if connection != self.connection or self.in_flight == 0:
+            return
+
+        self.in_flight -= 1
+        self.acked_count += 1
@@ -4,21 +4,295 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from skirmserv.game.player import Player
 
+from flask import current_app
 from flask_socketio import SocketIO  # Just for typing
 from skirmserv.game.game import Game
+from skirmserv.util.serializer import dumps
+from skirmserv.util.batch import defer_update
+from skirmserv.util.batch import pop_deferred_update
 
-import json
+import time
 from logging import getLogger
 
 
+class SpectatorRoom(object):
+    """
+    All spectators of a game. The spectators are joined to a socket.io room,
+    so every frame is built and encoded once and emitted to the whole room.
+
+    Spectators in delta mode are joined to a second room. They get a snapshot
+    when subscribing (or requesting a resync) and after that only the fields
+    changed since the last frame, numbered by a sequence number.
+
+    Changes and hit/shot events are collected and published as one frame at
+    most SPECTATOR_FRAME_RATE times per second. Hits and shots are sent as
+    arrays in the frame.
+    """
+
+    def __init__(self, game: Game, socketio: SocketIO):
+        self.game = game
+        self.socketio = socketio
+
+        self.room = "spectate/{0}".format(game.gid)
+        self.delta_room = "spectate/{0}/delta".format(game.gid)
+
+        # Amount of spectators in each room
+        self.spectator_count = 0
+        self.delta_spectator_count = 0
+
+        # Sequence number of the last delta frame
+        self.seq = 0
+
+        # Versions of the game, players and teams sent with the last delta
+        # frame (key is the object, value its pgt version)
+        self.sent_versions = {}
+
+        # Minimum seconds between two frames (0 -> no limit)
+        frame_rate = float(current_app.config["SPECTATOR_FRAME_RATE"])
+        self.frame_interval = 1 / frame_rate if frame_rate > 0 else 0
+
+        # State of the next frame
+        self.last_frame = 0
+        self.frame_timer = None  # Timer of the scheduled frame (see Game)
+        self.changed = False
+        self.hits = []
+        self.shots = []
+        self.delta_hits = []
+        self.delta_shots = []
+
+    def join(self, spectator: Spectator) -> None:
+        """Adds the given spectator to the room"""
+        if spectator.delta:
+            # Start tracking the changes with the first delta spectator
+            if self.delta_spectator_count == 0:
+                self.sent_versions = self._get_versions()
+
+            self.delta_spectator_count += 1
+            room = self.delta_room
+        else:
+            self.spectator_count += 1
+            room = self.room
+
+        self.socketio.server.enter_room(spectator.socket_id, room, namespace="/")
+
+    def leave(self, spectator: Spectator) -> None:
+        """Removes the given spectator from the room"""
+        if spectator.delta:
+            self.delta_spectator_count -= 1
+            room = self.delta_room
+        else:
+            self.spectator_count -= 1
+            room = self.room
+
+        self.socketio.server.leave_room(spectator.socket_id, room, namespace="/")
+
+    def emit(self, frame: dict, delta_frame: dict) -> None:
+        """Emits the given frame to all spectators of the game and the delta
+        frame to all spectators in delta mode. Empty frames are not sent"""
+        if self.spectator_count > 0 and frame:
+            self.socketio.emit("spectate", dumps(frame), to=self.room)
+
+        if self.delta_spectator_count > 0 and delta_frame:
+            self.socketio.emit("spectate", dumps(delta_frame), to=self.delta_room)
+
+    def get_snapshot(self) -> dict:
+        """Returns a frame containing all data of the game"""
+        players = [self.game.players[p].get_pgt_data() for p in self.game.players]
+        teams = [self.game.teams[t].get_pgt_data() for t in self.game.teams]
+        return {
+            "pgt": {
+                "game": self.game.get_pgt_data(),
+                "players": players,
+                "teams": teams,
+            }
+        }
+
+    def get_delta(self) -> dict:
+        """Returns a frame containing all fields changed since the last delta
+        frame. The frame contains no data if nothing changed"""
+        versions = self._get_versions()
+
+        game = self.game.get_pgt_changes(self.sent_versions.get(self.game, 0))
+        players = self._get_changes(self.game.players.values(), "p_id", "pid")
+        teams = self._get_changes(self.game.teams.values(), "t_id", "tid")
+
+        # Objects sent before but not part of the game anymore
+        removed_players = []
+        removed_teams = []
+        for obj in self.sent_versions:
+            if obj not in versions:
+                if hasattr(obj, "pid"):
+                    removed_players.append(obj.pid)
+                elif hasattr(obj, "tid"):
+                    removed_teams.append(obj.tid)
+
+        self.sent_versions = versions
+
+        delta = {}
+        if game:
+            delta.update({"game": game})
+        if players:
+            delta.update({"players": players})
+        if teams:
+            delta.update({"teams": teams})
+        if removed_players:
+            delta.update({"removed_players": removed_players})
+        if removed_teams:
+            delta.update({"removed_teams": removed_teams})
+
+        return delta
+
+    def _get_versions(self) -> dict:
+        """Returns the current pgt versions of the game, players and teams"""
+        versions = {self.game: self.game.pgt_version}
+        for player in self.game.players.values():
+            versions.update({player: player.pgt_version})
+        for team in self.game.teams.values():
+            versions.update({team: team.pgt_version})
+        return versions
+
+    def _get_changes(self, objects, id_key: str, id_attr: str) -> list:
+        """Returns the changed pgt fields of the given objects (players or
+        teams) since the last delta frame. Objects not sent before are
+        returned with all fields"""
+        changes = []
+        for obj in objects:
+            version = self.sent_versions.get(obj, None)
+            if version is None:
+                changes.append(obj.get_pgt_data())
+            elif version < obj.pgt_version:
+                data = obj.get_pgt_changes(version)
+                data.update({id_key: getattr(obj, id_attr)})
+                changes.append(data)
+        return changes
+
+    def update(self, full=True):
+        """
+        Marks the data of the game as changed. All spectators get the changes
+        with the next frame
+        """
+        if defer_update(self, full):
+            return
+
+        self.changed = True
+        self._schedule_frame()
+
+    def flush_update(self) -> None:
+        """Publishes the changes and events collected for the next frame now"""
+        if pop_deferred_update(self) is not None:
+            self.changed = True
+
+        self._publish()
+
+    def _schedule_frame(self) -> None:
+        """Publishes the next frame now or, if the last frame was sent less than
+        the frame interval ago, schedules it to the end of the interval"""
+        if self.frame_timer is not None:
+            return
+
+        delay = self.last_frame + self.frame_interval - time.time()
+        if delay <= 0:
+            self._publish()
+            return
+
+        # Cancelled when the game is closed
+        self.frame_timer = self.game.call_later(delay, self._publish)
+
+    def _publish(self) -> None:
+        """Sends the collected changes and events to all spectators. In delta
+        mode only the changed fields are sent"""
+        # A frame published now replaces the scheduled one
+        if self.frame_timer is not None:
+            self.frame_timer.cancel()
+            self.frame_timer = None
+
+        frame = {}
+        delta_frame = {}
+
+        if self.changed:
+            if self.spectator_count > 0:
+                frame.update(self.get_snapshot())
+
+            if self.delta_spectator_count > 0:
+                delta = self.get_delta()
+                if delta:
+                    self.seq += 1
+                    delta.update({"seq": self.seq})
+                    delta_frame.update({"delta": delta})
+
+        if self.hits:
+            frame.update({"hits": self.hits})
+        if self.shots:
+            frame.update({"shots": self.shots})
+        if self.delta_hits:
+            delta_frame.update({"hits": self.delta_hits})
+        if self.delta_shots:
+            delta_frame.update({"shots": self.delta_shots})
+
+        self.emit(frame, delta_frame)
+
+        self.last_frame = time.time()
+        self.changed = False
+        self.hits = []
+        self.shots = []
+        self.delta_hits = []
+        self.delta_shots = []
+
+        getLogger(__name__).debug("Updated spectators of game %s", str(self.game))
+
+    def player_got_hit(self, player: Player, opponent: Player, sid: int, hp: int = 7):
+        """Adds the hit to the next frame. A hit changes the data of the game"""
+        if self.spectator_count > 0:
+            self.hits.append(
+                {
+                    "player": player.get_pgt_data(),
+                    "by": opponent.get_pgt_data(),
+                    "sid": sid,
+                    "hp": hp,
+                }
+            )
+
+        # The data of the players is part of the delta frames
+        if self.delta_spectator_count > 0:
+            self.delta_hits.append(
+                {"player": player.pid, "by": opponent.pid, "sid": sid, "hp": hp}
+            )
+
+        self.update()
+        getLogger(__name__).debug(
+            "Informed spectators that player %s got hit", str(player)
+        )
+
+    def player_fired_shot(self, player: Player, sid: int) -> None:
+        """Adds the shot to the next frame"""
+        if self.spectator_count > 0:
+            self.shots.append({"player": player.get_pgt_data(), "sid": sid})
+
+        if self.delta_spectator_count > 0:
+            self.delta_shots.append({"player": player.pid, "sid": sid})
+
+        self._schedule_frame()
+        getLogger(__name__).debug(
+            "Informed spectators that player %s fired a shot", str(player)
+        )
+
+
 class Spectator(object):
-    def __init__(self, socket_id: str, game: Game, socketio: SocketIO):
+    def __init__(self, socket_id: str, game: Game, socketio: SocketIO, delta=False):
         self.socket_id = socket_id
         self.game = game
 
         self.socketio = socketio
 
+        # Receive only changed fields after the first snapshot
+        self.delta = delta
+
+        # The first spectator of a game creates the room
+        if self.game.spectator_room is None:
+            self.game.spectator_room = SpectatorRoom(self.game, self.socketio)
+
         self.game.spectators.add(self)
+        self.game.spectator_room.join(self)
 
         self.update()
 
@@ -26,58 +300,22 @@ class Spectator(object):
         """
         Removes the instance from the games list of spectators
         """
-        self.game.spectators.remove(self)
+        if self in self.game.spectators:
+            self.game.spectators.remove(self)
+            self.game.spectator_room.leave(self)
         getLogger(__name__).debug("Closed spectator %s", str(self))
 
     def update(self):
         """
-        Updates all data for the spectator
+        Sends all data of the game to this spectator. In delta mode the
+        snapshot contains the sequence number of the last delta frame
         """
-        players = [self.game.players[p].get_pgt_data() for p in self.game.players]
-        teams = [self.game.teams[t].get_pgt_data() for t in self.game.teams]
-        self.socketio.emit(
-            "spectate",
-            json.dumps(
-                {
-                    "pgt": {
-                        "game": self.game.get_pgt_data(),
-                        "players": players,
-                        "teams": teams,
-                    }
-                }
-            ),
-            to=self.socket_id,
-        )
-        getLogger(__name__).debug("Updated spectator %s", str(self))
-
-    def player_got_hit(self, player: Player, opponent: Player, sid: int, hp: int = 7):
-        self.socketio.emit(
-            "spectate",
-            json.dumps(
-                {
-                    "hit": {
-                        "player": player.get_pgt_data(),
-                        "by": opponent.get_pgt_data(),
-                        "sid": sid,
-                        "hp": hp,
-                    }
-                }
-            ),
-            to=self.socket_id,
-        )
-        getLogger(__name__).debug(
-            "Informed spectator %s that player %s got hit", str(self), str(player)
-        )
+        frame = self.game.spectator_room.get_snapshot()
+        if self.delta:
+            frame.update({"seq": self.game.spectator_room.seq})
 
-    def player_fired_shot(self, player: Player, sid: int) -> None:
-        self.socketio.emit(
-            "spectate",
-            json.dumps({"shot": {"player": player.get_pgt_data(), "sid": sid}}),
-            to=self.socket_id,
-        )
-        getLogger(__name__).debug(
-            "Informed spectator %s that player %s fired a shot", str(self), str(player)
-        )
+        self.socketio.emit("spectate", dumps(frame), to=self.socket_id)
+        getLogger(__name__).debug("Updated spectator %s", str(self))
 
     def __str__(self):
         return "{0} ({1})".format(self.game, self.socket_id)
@@ -12,16 +12,49 @@ default_config = {
     # Misc
     "SECRET_KEY": "",  # Flask Secret Key
     "LOGGING_LEVEL": "INFO",
+    "SPECTATOR_FRAME_RATE": 15,  # Max. frames per second sent to spectators
+    "TIMESYNC_SAMPLES": 8,  # Samples per clock synchronisation of a client
+    "CLIENT_IDLE_TIMEOUT": 600,  # Seconds until idle/closed clients are removed
+    "CLIENT_REAP_INTERVAL": 60,  # Seconds between the checks for idle clients
+    "CLIENT_QUEUE_SIZE": 32,  # Messages queued per client until they are merged
+    "CLIENT_MAX_IN_FLIGHT": 16,  # Unacknowledged messages until queueing
+    "REPLAY_BUFFER_SIZE": 64,  # Messages kept per client to resume sessions
+    "SHOT_WINDOW_SIZE": 256,  # Recent shots per player checked for double hits
+    "SHOT_ID_RANGE": 65536,  # Shot ids of a phaser wrap around at this value
+    "GAME_IDLE_TIMEOUT": 900,  # Seconds until games without phasers are closed
+    "GAME_MAX_AGE": 0,  # Seconds until games are closed (0 for no limit)
+    "GAME_REAP_INTERVAL": 60,  # Seconds between the checks for abandoned games
+    "TOKEN_CACHE_SIZE": 1024,  # Users cached by access token (0 to disable)
+    "TOKEN_CACHE_TTL": 300,  # Seconds a user is cached by access token
+    "ACCESS_TOKEN_FORMAT": "random",  # One of random, signed (needs SECRET_KEY)
+    "TOKEN_GENERATIONS_SIZE": 4096,  # Users whose signed token generation is known
+    "TOKEN_GENERATIONS_TTL": 3600,  # Seconds a signed token generation is known
+    "PASSWORD_POOL_SIZE": 2,  # Threads hashing passwords (0 to hash directly)
+    "ARGON2_TIME_COST": 3,  # Iterations of argon2
+    "ARGON2_MEMORY_COST": 65536,  # Memory used by argon2 in KiB
+    "ARGON2_PARALLELISM": 4,  # Parallel threads used by argon2
     ## Database
     "DB_TYPE": "sqlite",  # Database type (one of sqlite, mysql, postgresql)
     # Keys for DB_TYPE mysql
     "DB_LOCATION": "db_dev.sqlite3",  # Database path
+    "DB_SQLITE_PROFILE": "default",  # One of default, performance
+    "DB_SQLITE_MMAP_SIZE": 67108864,  # Bytes of the file mapped to memory
+    "DB_SQLITE_CACHE_SIZE": 16384,  # KiB used for the page cache
+    "DB_SQLITE_BUSY_TIMEOUT": 5,  # Seconds to wait for a locked database
     # Keys for DB_TYPE mysql or postgresql
     "DB_HOST": None,
     "DB_PORT": None,
     "DB_DATABASE": None,
     "DB_USER": None,
     "DB_PASS": None,
+    # Writes that are done in the background (like statistics)
+    "DB_WRITE_BEHIND": "batched",  # One of batched, sync
+    "DB_WRITE_INTERVAL": 100,  # Milliseconds queued writes wait for more
+    "DB_WRITE_BATCH_SIZE": 100,  # Queued writes that are written directly
+    # Connection pool for DB_TYPE mysql or postgresql
+    "DB_MAX_CONNECTIONS": 0,  # Size of the pool (0 for a single connection)
+    "DB_STALE_TIMEOUT": 300,  # Seconds until a pooled connection is replaced
+    "DB_POOL_TIMEOUT": 10,  # Seconds to wait for a free connection
 }
 
 _g = globals()
@@ -13,12 +13,34 @@ if TYPE_CHECKING:
     from skirmserv.game.gamemode import Gamemode
     from skirmserv.models.user import UserModel
 
+from skirmserv.game.pgt import PGTObject
+from skirmserv.util.ranking import RankIndex
+from skirmserv.util.shots import ShotStore
+from skirmserv.game.timer_service import Timer, TimerService
+from skirmserv.util.batch import batch_updates
+from skirmserv.util.stats import percentiles
+
+from flask import current_app
+
+import sys
 import time
 from logging import getLogger
 
 
-class Game(object):
+class Game(PGTObject):
+    # Fields in pgt format
+    PGT_FIELDS = {
+        "gid": lambda g: {"g_id": g.gid},
+        "player_count": lambda g: {"g_pc": g.get_player_count()},
+        "team_count": lambda g: {"g_tc": g.get_team_count()},
+        "start_time": lambda g: {"g_st": int(g.start_time)},
+        "created_at": lambda g: {"g_ca": int(g.created_at)},
+        "created_by": lambda g: {"g_cb": g.created_by.name},
+    }
+
     def __init__(self, gamemode: Type[Gamemode], gid: str, created_by: UserModel):
+        super().__init__()
+
         self.gid = gid
 
         self.created_by = created_by
@@ -27,34 +49,51 @@ class Game(object):
         # Timestamp for the scheduled start
         # 0 -> no start scheduled
         self.start_time = 0
+        self.start_timer = None
+
+        # Pending timers of this game, cancelled when the game is closed
+        self.timers = set()
 
         # Sets of players and teams which are part of this game
         self.players = {}
         self.teams = {}
 
-        # Spectators spectating this game
+        # Players and teams ordered by points to look up their ranks
+        self.player_ranks = RankIndex()
+        self.team_ranks = RankIndex()
+
+        # Spectators spectating this game and the room sending them
+        # updates (created by the first spectator)
         self.spectators = set()
+        self.spectator_room = None
 
-        # Shots
-        self._already_hit_shots = set()
+        # Recent shots of every player and the players they hit
+        self.shots = ShotStore(
+            int(current_app.config["SHOT_WINDOW_SIZE"]),
+            int(current_app.config["SHOT_ID_RANGE"]),
+        )
 
         self.gamemode = gamemode(self)  # Creates a new instance of the gamemode
 
     def update_spectators(self) -> None:
         """Updates all spectators for this game"""
-        for spectator in self.spectators:
-            spectator.update()
-
-    def get_pgt_data(self) -> dict:
-        """Generates a dict containing all fields in pgt format"""
-        return {
-            "g_id": self.gid,
-            "g_pc": self.get_player_count(),
-            "g_tc": self.get_team_count(),
-            "g_st": int(self.start_time),
-            "g_ca": int(self.created_at),
-            "g_cb": self.created_by.name,
-        }
+        if self.spectator_room is not None:
+            self.spectator_room.update()
+
+    def player_points_changed(self, player: Player, difference: int) -> None:
+        """Updates the rank of the given player and the points of its team.
+        Called when the points of the player changed by difference"""
+        for p in self.player_ranks.update(player, player.points):
+            p.mark_changed("rank")
+
+        if player.team is not None:
+            player.team.points += difference
+
+    def team_points_changed(self, team: Team) -> None:
+        """Updates the rank of the given team. Called when the points
+        of the team changed"""
+        for t in self.team_ranks.update(team, team.points):
+            t.mark_changed("rank")
 
     def get_next_pid(self) -> int:
         """Returns the next available player id"""
@@ -85,34 +124,49 @@ class Game(object):
     def add_player(self, player: Player) -> None:
         """Adds the given player to this game"""
         self.players.update({player.pid: player})
+        self.mark_changed("player_count")
+        for p in self.player_ranks.add(player, player.points):
+            p.mark_changed("rank")
         self.gamemode.player_joined(player)
         self.update_spectators()
 
     def remove_player(self, player: Player) -> None:
         """Removes the given player from this game"""
         self.players.pop(player.pid)
+        self.shots.remove(player.pid)
+        self.mark_changed("player_count")
+        for p in self.player_ranks.remove(player):
+            p.mark_changed("rank")
         self.gamemode.player_leaving(player)
         self.update_spectators()
 
     def add_team(self, team: Team) -> None:
         self.teams.update({team.tid: team})
+        self.mark_changed("team_count")
+        for t in self.team_ranks.add(team, team.points):
+            t.mark_changed("rank")
         self.update_spectators()
 
     def remove_team(self, team: Team) -> None:
         """Removes the given team from this game (and all players from that team)"""
-        players = list(team.players.values())
-        for player in players:
-            team.leave(player)
+        with batch_updates():
+            players = list(team.players.values())
+            for player in players:
+                team.leave(player)
 
-        self.teams.pop(team.tid)
-        self.update_spectators()
+            self.teams.pop(team.tid)
+            self.mark_changed("team_count")
+            for t in self.team_ranks.remove(team):
+                t.mark_changed("rank")
+            self.update_spectators()
 
     def move_player_to_team(self, player: Player, team: Team) -> None:
-        # Remove player from current team
-        if player.team is not None:
-            player.team.leave(player)
-        # Add it to the new team
-        team.join(player)
+        with batch_updates():
+            # Remove player from current team
+            if player.team is not None:
+                player.team.leave(player)
+            # Add it to the new team
+            team.join(player)
 
     def schedule_start(self, delay: int) -> bool:
         """Schedules the game start in delay seconds"""
@@ -121,48 +175,95 @@ class Game(object):
 
         self.start_time = time.time() + delay
 
+        # A new schedule replaces the previous one
+        if self.start_timer is not None:
+            self.start_timer.cancel()
+        self.start_timer = self.call_at(self.start_time, self.start)
+
         hp_init_values = {}
         for hpmode in range(0, 8):
             c = self.gamemode.hitpoint_init(hpmode)
             if c is not None:
                 hp_init_values.update({hpmode: c})
 
-        for player in self.players.values():
-            # Let the gamemode handle things that happen on game start
-            self.gamemode.player_game_start(player)
-
-            for hpmode in hp_init_values:
-                player.client.trigger_action(
-                    player.client.ACTION_HP_INIT,
-                    hpmode=hpmode,
-                    color_r=hp_init_values[hpmode][0],
-                    color_g=hp_init_values[hpmode][1],
-                    color_b=hp_init_values[hpmode][2],
-                )
+        # Every player gets a single update (per hitpoint mode) for the start
+        with batch_updates():
+            for player in self.players.values():
+                # Let the gamemode handle things that happen on game start
+                self.gamemode.player_game_start(player)
+
+                for hpmode in hp_init_values:
+                    player.client.trigger_action(
+                        player.client.ACTION_HP_INIT,
+                        hpmode=hpmode,
+                        color_r=hp_init_values[hpmode][0],
+                        color_g=hp_init_values[hpmode][1],
+                        color_b=hp_init_values[hpmode][2],
+                    )
+                    player.client.update()
+                # Inform the player about updates
                 player.client.update()
-            # Inform the player about updates
-            player.client.update()
 
-        self.update_spectators()
+            self.update_spectators()
+
         getLogger(__name__).info(
             "Scheduled game %s starting in %d sec", str(self), delay
         )
 
         return True
 
+    def start(self) -> None:
+        """Starts this game, called at the scheduled start time"""
+        self.start_timer = None
+
+        with batch_updates():
+            self.gamemode.game_started()
+            for player in self.players.values():
+                player.client.update()
+            self.update_spectators()
+
+        getLogger(__name__).info("Started game %s", str(self))
+
+    def call_at(self, when: float, function, *args, **kwargs) -> Timer:
+        """Calls the function with the given arguments at the given timestamp
+        (see TimerService). The timer is cancelled if the game is closed"""
+        timer = TimerService.call_at(when, function, *args, **kwargs)
+        timer.on_done = self.timers.discard
+        self.timers.add(timer)
+        return timer
+
+    def call_later(self, delay: float, function, *args, **kwargs) -> Timer:
+        """Calls the function with the given arguments in delay seconds (see
+        TimerService). The timer is cancelled if the game is closed"""
+        return self.call_at(time.time() + delay, function, *args, **kwargs)
+
     def close(self) -> None:
         """Close this game"""
-        for player in self.players:
-            self.gamemode.player_leaving(player)
-            player.client.update()
+        # Cancelled timers remove themselves from the set
+        for timer in list(self.timers):
+            timer.cancel()
+        self.start_timer = None
+
+        with batch_updates():
+            for player in self.players.values():
+                self.gamemode.player_leaving(player)
+                player.client.update()
 
         del self.players
         del self.teams
         self.players = {}
         self.teams = {}
+        self.player_ranks.clear()
+        self.team_ranks.clear()
+        self.shots.clear()
+        self.mark_changed("player_count", "team_count")
+
+        # Send the last update to the spectators before closing them
+        self.update_spectators()
+        if self.spectator_room is not None:
+            self.spectator_room.flush_update()
 
-        for spectator in self.spectators:
-            spectator.update()
+        for spectator in list(self.spectators):
             spectator.close()
 
         getLogger(__name__).debug("Closed game %s", str(self))
@@ -170,44 +271,20 @@ class Game(object):
     def get_team_rank(self, team: Team) -> int:
         """Returns the rank of the given team. Returns -1 if the
         Team is not part of this game"""
-
-        # Return -1 if the team is not part of this game
-        if not team in self.teams.values():
-            return -1
-
-        # Creating a list of teams (to be able to order them)
-        # then sort it by points and then reversing the order so
-        # that the first item is the first rank and so on
-        team_list = list(self.teams.values())
-        team_list.sort(key=lambda x: x.get_points())
-        team_list = team_list[::-1]
-
-        # Rank is the index of the team_list. + 1 is added that the
-        # first place is not 0 but 1
-        rank = team_list.index(team) + 1
-
-        return rank
+        return self.team_ranks.get_rank(team)
 
     def get_player_rank(self, player: Player) -> int:
         """Returns the rank of the given player. Returns -1 if the
         player is not part of this game"""
+        return self.player_ranks.get_rank(player)
 
-        # Return -1 if the player is not part of this game
-        if not player in self.players.values():
-            return -1
-
-        # Creating a list of players (to be able to order them)
-        # then sort it by points and then reversing the order so
-        # that the first item is the first rank and so on
-        player_list = list(self.players.values())
-        player_list.sort(key=lambda x: x.points)
-        player_list = player_list[::-1]
+    def get_team_ranks(self) -> dict:
+        """Returns a dict containing the rank (value) of every team (key)"""
+        return self.team_ranks.get_ranks()
 
-        # Rank is the index of the player_list. + 1 is added that the
-        # first place is not 0 but 1
-        rank = player_list.index(player) + 1
-
-        return rank
+    def get_player_ranks(self) -> dict:
+        """Returns a dict containing the rank (value) of every player (key)"""
+        return self.player_ranks.get_ranks()
 
     def get_player_count(self) -> int:
         """Returns the amount of players in this game"""
@@ -217,6 +294,38 @@ class Game(object):
         """Returns the amount of teams in this game"""
         return len(self.teams)
 
+    def get_rtt_percentiles(self) -> dict:
+        """Returns percentiles of the recent round trip times in seconds of
+        all clients in this game"""
+        samples = []
+        for player in self.players.values():
+            samples.extend(player.client.rtt_samples)
+        return percentiles(samples)
+
+    def get_abandoned_since(self) -> float:
+        """Returns the timestamp since no phaser of this game is connected
+        anymore, 0 if a phaser is connected"""
+        if len(self.players) == 0:
+            return self.created_at
+
+        abandoned_since = 0
+        for player in self.players.values():
+            if player.client.connection_closed == 0:
+                return 0
+            abandoned_since = max(abandoned_since, player.client.connection_closed)
+        return abandoned_since
+
+    def get_memory_estimate(self) -> int:
+        """Returns a rough estimate of the bytes used by this game, its
+        players and teams (without their clients)"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        for objects in (self.players, self.teams):
+            size += sys.getsizeof(objects)
+            for o in objects.values():
+                size += sys.getsizeof(o) + sys.getsizeof(o.__dict__)
+
+        return size + self.shots.get_memory_estimate()
+
     def get_player_index(self, player: Player) -> int:
         """Returns a number from 0 ... player count, do not use this number to
         identify the player but for thing where you need a count of players not
@@ -231,13 +340,10 @@ class Game(object):
         # Return the index of the player
         return player_list.index(player)
 
-    def is_first_hit(self, player: Player, sid: int) -> bool:
-        """Checks if the shot by the player has hit the first time
-        or is already marked as hit."""
-        psid = sid << 8 | player.pid  # Combined player / shot id
-        result = psid in self._already_hit_shots
-        self._already_hit_shots.add(psid)
-        return result
+    def is_first_hit(self, player: Player, opponent: Player, sid: int) -> bool:
+        """Checks if the shot sid by the opponent has hit the player the
+        first time or is already marked as hit."""
+        return self.shots.hit(opponent.pid, sid, player.pid)
 
     def __str__(self):
         return self.gid
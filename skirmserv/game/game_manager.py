@@ -3,6 +3,7 @@ Skirmish Server
 
 Copyright (C) 2022 Ole Lange
 """
+
 from __future__ import annotations
 
 from typing import TYPE_CHECKING
@@ -11,12 +12,16 @@ if TYPE_CHECKING:
     from skirmserv.communication import SocketClient
     from skirmserv.models.user import UserModel
 
+from flask import current_app
+
 from skirmserv.game.player import Player
 from skirmserv.game.game import Game
+from skirmserv.game.timer_service import TimerService
 from skirmserv.gamemodes import available_gamemodes
 
 from skirmserv.util.words import get_random_word_string
 
+import time
 from logging import getLogger
 
 
@@ -41,6 +46,10 @@ class GameManager(object):
 
         self.games = {}
 
+        self.reaped_abandoned = 0  # Total count of closed abandoned games
+        self.reaped_expired = 0  # Total count of closed too old games
+        self.reclaimed_bytes = 0  # Estimated memory of all closed games
+
     # Singleton wrapper methods
     @staticmethod
     def get_game(gid: str) -> Game:
@@ -54,8 +63,9 @@ class GameManager(object):
         return GameManager.get_instance()._create_game(gamemode, created_by)
 
     @staticmethod
-    def start_game(gid: str, delay: int) -> None:
-        """Startes the game with the given gid in `delay` seconds"""
+    def start_game(gid: str, delay: int) -> bool:
+        """Startes the game with the given gid in `delay` seconds. Returns
+        if the start was scheduled"""
         return GameManager.get_instance()._start_game(gid, delay)
 
     @staticmethod
@@ -75,6 +85,24 @@ class GameManager(object):
         """Closes the game with the given gid."""
         return GameManager.get_instance()._close_game(gid)
 
+    @staticmethod
+    def start_reaper() -> None:
+        """Starts closing abandoned (no phaser connected for GAME_IDLE_TIMEOUT
+        seconds) and too old (GAME_MAX_AGE) games without a connected phaser
+        every GAME_REAP_INTERVAL seconds"""
+        return GameManager.get_instance()._start_reaper()
+
+    @staticmethod
+    def reap_games() -> dict:
+        """Closes all abandoned and too old games. Returns the count of
+        closed games"""
+        return GameManager.get_instance()._reap_games()
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Returns the count of games and players and of the closed games"""
+        return GameManager.get_instance()._get_stats()
+
     # Singleton Wrapper wrapped methods
 
     def _get_game(self, gid: str) -> Game:
@@ -108,9 +136,14 @@ class GameManager(object):
 
         return gid
 
-    def _start_game(self, gid: str, delay: int) -> None:
-        """Startes the game with the given gid in `delay` seconds"""
-        raise NotImplementedError("Todo: Start Game")
+    def _start_game(self, gid: str, delay: int) -> bool:
+        """Startes the game with the given gid in `delay` seconds. Returns
+        if the start was scheduled"""
+        game = self._get_game(gid)
+        if game is None:
+            return False
+
+        return game.schedule_start(delay)
 
     def _join_game(self, game: Game, client: SocketClient) -> Player:
         """Joines this client to the game with the given gid. Returns the
@@ -178,3 +211,70 @@ class GameManager(object):
 
             self.games.pop(game.gid)
             del game
+
+    def _start_reaper(self) -> None:
+        """Schedules the first check for abandoned games"""
+        self.idle_timeout = float(current_app.config["GAME_IDLE_TIMEOUT"])
+        self.max_age = float(current_app.config["GAME_MAX_AGE"])
+        interval = float(current_app.config["GAME_REAP_INTERVAL"])
+
+        if interval > 0:
+            TimerService.call_later(interval, self._reaper_timer, interval)
+
+    def _reaper_timer(self, interval: float) -> None:
+        """Closes abandoned games and schedules the next check"""
+        try:
+            self._reap_games()
+        finally:
+            TimerService.call_later(interval, self._reaper_timer, interval)
+
+    def _reap_games(self) -> dict:
+        """Closes all abandoned and too old games"""
+        now = time.time()
+        abandoned = []
+        expired = []
+        for game in self.games.values():
+            # Games with a connected phaser are never closed
+            abandoned_since = game.get_abandoned_since()
+            if abandoned_since == 0:
+                continue
+
+            if now - abandoned_since > self.idle_timeout:
+                abandoned.append(game)
+            elif self.max_age > 0 and now - game.created_at > self.max_age:
+                expired.append(game)
+
+        reclaimed = 0
+        for game in abandoned + expired:
+            reclaimed += game.get_memory_estimate()
+
+            # The players leave the game like they left themselves, the last
+            # one closes the game
+            for player in list(game.players.values()):
+                player.client.reset()
+            self._close_game(game.gid)
+
+        self.reaped_abandoned += len(abandoned)
+        self.reaped_expired += len(expired)
+        self.reclaimed_bytes += reclaimed
+
+        if len(abandoned) + len(expired) > 0:
+            getLogger(__name__).info(
+                "Closed %d abandoned and %d expired games (about %d KiB), "
+                "%d games left",
+                len(abandoned),
+                len(expired),
+                reclaimed // 1024,
+                len(self.games),
+            )
+
+        return {"abandoned": len(abandoned), "expired": len(expired)}
+
+    def _get_stats(self) -> dict:
+        return {
+            "games": len(self.games),
+            "players": sum(len(game.players) for game in self.games.values()),
+            "reaped_abandoned": self.reaped_abandoned,
+            "reaped_expired": self.reaped_expired,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
@@ -57,6 +57,12 @@ class Gamemode(object):
         sends a shot."""
         pass
 
+    def game_started(self) -> None:
+        """Override this method and handle what should happen when the
+        scheduled start time of the game is reached. Timers for later events
+        can be set using game.call_later"""
+        pass
+
     def player_leaving_team(self, player: Player, team: Team):
         """Override this method and handle what should happen when a player
         leaves a team."""
@@ -0,0 +1,60 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+
+class PGTObject(object):
+    """Base class for objects that are sent to the clients in pgt format
+    (player/game/team).
+
+    Inheriting classes list their fields in PGT_FIELDS. The key is the name of
+    the field and the value a function returning the pgt keys and values of
+    this field. Assigning a new value to an attribute with the name of a field
+    marks the field as changed, fields not stored as attribute (like ranks or
+    counts) have to be marked using mark_changed.
+
+    Every change increments the version of the object and stores it for the
+    changed fields, so that only fields changed since a known version can be
+    collected using get_pgt_changes."""
+
+    PGT_FIELDS = {}
+
+    def __init__(self):
+        self.pgt_version = 0
+        self.pgt_versions = {}  # key is the field name, value its version
+
+    def __setattr__(self, name, value):
+        # Only mark fields whose value really changed
+        changed = name in self.PGT_FIELDS and self.__dict__.get(name, None) != value
+        object.__setattr__(self, name, value)
+        if changed:
+            self.mark_changed(name)
+
+    def mark_changed(self, *fields: str) -> None:
+        """Marks the given fields as changed"""
+        self.pgt_version += 1
+        for field in fields:
+            self.pgt_versions[field] = self.pgt_version
+
+    def get_pgt_data(self) -> dict:
+        """Generates a dict containing all fields in pgt format"""
+        data = {}
+        for get_field in self.PGT_FIELDS.values():
+            data.update(get_field(self))
+        return data
+
+    def get_pgt_changes(self, since: int) -> dict:
+        """Generates a dict containing all fields in pgt format that were
+        changed after the given version"""
+        data = {}
+
+        # Nothing changed since the given version
+        if since >= self.pgt_version:
+            return data
+
+        for field, version in self.pgt_versions.items():
+            if version > since:
+                data.update(self.PGT_FIELDS[field](self))
+        return data
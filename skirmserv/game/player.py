@@ -12,11 +12,40 @@ if TYPE_CHECKING:
     from skirmserv.game.team import Team
     from skirmserv.communication.client import SocketClient
 
+from skirmserv.game.pgt import PGTObject
+from skirmserv.util.batch import batch_updates
+
 from logging import getLogger
 
 
-class Player(object):
+class Player(PGTObject):
+    # Fields in pgt format
+    PGT_FIELDS = {
+        "pid": lambda p: {"p_id": p.pid},
+        "name": lambda p: {"p_n": p.name},
+        "health": lambda p: {"p_h": p.health},
+        "points": lambda p: {"p_p": p.points},
+        "color": lambda p: {
+            "p_cr": p.color[0],
+            "p_cg": p.color[1],
+            "p_cb": p.color[2],
+        },
+        "color_before_game": lambda p: {"p_cbg": p.color_before_game},
+        "ammo_limit": lambda p: {"p_al": p.ammo_limit},
+        # todo: set only diff for ammo or some other solution?
+        "ammo": lambda p: {"p_a": p.ammo},
+        "phaser_enable": lambda p: {"p_pe": p.phaser_enable},
+        "phaser_disable_until": lambda p: {"p_pdu": int(p.phaser_disable_until)},
+        "max_shot_interval": lambda p: {"p_msi": p.max_shot_interval},
+        "rank": lambda p: {"p_r": p.get_rank()},
+        "inviolable": lambda p: {"p_i": p.inviolable},
+        "inviolable_until": lambda p: {"p_iu": int(p.inviolable_until)},
+        "inviolable_lights_off": lambda p: {"p_ilo": p.inviolable_lights_off},
+    }
+
     def __init__(self, game: Game, client: SocketClient):
+        super().__init__()
+
         # Reference to game and team
         self.game = game
         self.team = None
@@ -39,28 +68,14 @@ class Player(object):
         self.inviolable_until = 0
         self.inviolable_lights_off = True
 
-    def get_pgt_data(self) -> dict:
-        """Generates a dict containing all fields in pgt format"""
-        return {
-            "p_id": self.pid,
-            "p_n": self.name,
-            "p_h": self.health,
-            "p_p": self.points,
-            "p_cr": self.color[0],
-            "p_cg": self.color[1],
-            "p_cb": self.color[2],
-            "p_cbg": self.color_before_game,
-            "p_al": self.ammo_limit,
-            "p_a": self.ammo,  # todo: set only diff for ammo or
-            # some other solution?
-            "p_pe": self.phaser_enable,
-            "p_pdu": int(self.phaser_disable_until),
-            "p_msi": self.max_shot_interval,
-            "p_r": self.get_rank(),
-            "p_i": self.inviolable,
-            "p_iu": int(self.inviolable_until),
-            "p_ilo": self.inviolable_lights_off,
-        }
+    def __setattr__(self, name, value):
+        # Points of a player affect the ranks and the team points
+        if name == "points":
+            difference = value - self.__dict__.get("points", 0)
+            super().__setattr__(name, value)
+            self.game.player_points_changed(self, difference)
+        else:
+            super().__setattr__(name, value)
 
     def add_ammo(self, amount: int) -> None:
         """Triggers the add ammo action on the phaser with the given amount"""
@@ -90,8 +105,8 @@ class Player(object):
             "Player %s send shot %d in game %s", str(self), sid, str(self.game)
         )
 
-        for spectator in self.game.spectators:
-            spectator.player_fired_shot(self, sid)
+        if self.game.spectator_room is not None:
+            self.game.spectator_room.player_fired_shot(self, sid)
 
     def got_hit(self, pid: int, sid: int, hp: int = 7) -> None:
         """This function is called when the phaser/breast calls the
@@ -106,16 +121,17 @@ class Player(object):
 
         # Let the gamemode handle this event
         # but first check if this shot has never hit before
-        if not self.game.is_first_hit(self, sid):
-            self.game.gamemode.player_got_hit(self, opponent, sid, hp)
+        with batch_updates():
+            if not self.game.is_first_hit(self, opponent, sid):
+                self.game.gamemode.player_got_hit(self, opponent, sid, hp)
 
-            # Also let the gamemode handle the event that the
-            # other player has hit
-            self.game.gamemode.player_has_hit(opponent, self, sid, hp)
+                # Also let the gamemode handle the event that the
+                # other player has hit
+                self.game.gamemode.player_has_hit(opponent, self, sid, hp)
 
-        # inform both clients about updates
-        self.client.update()
-        opponent.client.update()
+            # inform both clients about updates
+            self.client.update()
+            opponent.client.update()
 
         hp_name = [
             "Phaser",
@@ -136,9 +152,9 @@ class Player(object):
             str(self.game),
         )
 
-        self.game.update_spectators()
-        for spectator in self.game.spectators:
-            spectator.player_got_hit(self, opponent, sid, hp)
+        # Spectators get the hit and the changed data with the next frame
+        if self.game.spectator_room is not None:
+            self.game.spectator_room.player_got_hit(self, opponent, sid, hp)
 
     def __str__(self):
         return "{0} ({1})".format(self.name, self.pid)
@@ -11,33 +11,44 @@ if TYPE_CHECKING:
     from skirmserv.game.game import Game
     from skirmserv.game.player import Player
 
+from skirmserv.game.pgt import PGTObject
+
 from logging import getLogger
 
 
-class Team(object):
+class Team(PGTObject):
+    # Fields in pgt format
+    PGT_FIELDS = {
+        "tid": lambda t: {"t_id": t.tid},
+        "player_count": lambda t: {"t_pc": t.get_player_count()},
+        "points": lambda t: {"t_p": t.points},
+        "rank": lambda t: {"t_r": t.get_rank()},
+        "name": lambda t: {"t_n": t.name},
+    }
+
     def __init__(self, game: Game, tid: int, name: str):
+        super().__init__()
+
         self.game = game
         self.players = {}
 
         self.tid = tid
         self.name = name
 
-    def get_pgt_data(self) -> dict:
-        """Generates a dict containing all fields in pgt format"""
-        return {
-            "t_id": self.tid,
-            "t_pc": self.get_player_count(),
-            "t_p": self.get_points(),
-            "t_r": self.get_rank(),
-            "t_n": self.name,
-        }
+        # Sum of points from every player, kept up to date on changes of
+        # the players points and when players join or leave
+        self.points = 0
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        # Points of a team affect the ranks
+        if name == "points":
+            self.game.team_points_changed(self)
 
     def get_points(self) -> int:
         """Returns the sum of points from every player"""
-        result = 0
-        for player in self.players.values():
-            result += player.points
-        return result
+        return self.points
 
     def get_rank(self) -> int:
         """Returns the rank of this team"""
@@ -49,8 +60,12 @@ class Team(object):
 
     def join(self, player: Player):
         """Adds a new player to this team"""
+        if player.pid not in self.players:
+            self.points += player.points
+
         self.players.update({player.pid: player})
         player.team = self
+        self.mark_changed("player_count")
 
         self.game.gamemode.player_joining_team(player, self)
         player.client.update()
@@ -63,6 +78,8 @@ class Team(object):
             self.game.gamemode.player_leaving_team(player, self)
             self.players.pop(player.pid)
             player.team = None
+            self.mark_changed("player_count")
+            self.points -= player.points
 
             player.client.update()
 
@@ -0,0 +1,169 @@
+"""
+Skirmish Server
+
+Timers calling functions at a given time, like the start of a scheduled
+game. All timers of the process are kept in one heap ordered by their due
+time and called by a single background task, which sleeps until the next
+timer is due (or an earlier timer is added).
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from flask import current_app
+
+import heapq
+import itertools
+import time
+
+from logging import getLogger
+
+
+class Timer(object):
+    """A scheduled call of a function, returned by the TimerService"""
+
+    def __init__(self, when: float, function, args, kwargs):
+        self.when = when  # Timestamp the function is called at
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.done = False
+
+        # Called with this timer when it is called or cancelled
+        self.on_done = None
+
+    def cancel(self) -> None:
+        """Cancels this timer, the function is not called anymore"""
+        if not self.cancelled and not self.done:
+            self.cancelled = True
+            TimerService.get_instance()._timer_cancelled()
+            self._finished()
+
+    def is_pending(self) -> bool:
+        return not self.cancelled and not self.done
+
+    def _finished(self) -> None:
+        """Calls on_done once"""
+        on_done, self.on_done = self.on_done, None
+        if on_done is not None:
+            on_done(self)
+
+
+class TimerService(object):
+    instance = None
+
+    @staticmethod
+    def get_instance():
+        """Returns the current instance of this class, if there is no
+        instance of this class a new one is created (using the socketio
+        server of the current app) and returned"""
+        if TimerService.instance is not None:
+            return TimerService.instance
+        else:
+            TimerService()
+            return TimerService.instance
+
+    def __init__(self):
+        if TimerService.instance is not None:
+            # Create a new instance only if there is no existing
+            return
+        TimerService.instance = self
+
+        self.app = current_app._get_current_object()
+        self.socketio = current_app.extensions["socketio"]
+
+        # Heap of (when, counter, timer) tuples, the counter keeps timers
+        # with the same time in order of adding them
+        self.heap = []
+        self.counter = itertools.count()
+        self.cancelled_count = 0  # Cancelled timers still in the heap
+
+        self.fired_count = 0
+        self.failed_count = 0
+
+        # Set to wake up the background task when an earlier timer is added
+        self.wakeup = self.socketio.server.eio.create_event()
+        self.socketio.start_background_task(self._timer_loop)
+
+    # Singleton Wrapper methods
+    @staticmethod
+    def call_at(when: float, function, *args, **kwargs) -> Timer:
+        """Calls the function with the given arguments at the given timestamp
+        (like time.time()) within the app context. Returns the timer"""
+        return TimerService.get_instance()._call_at(when, function, *args, **kwargs)
+
+    @staticmethod
+    def call_later(delay: float, function, *args, **kwargs) -> Timer:
+        """Calls the function with the given arguments in delay seconds
+        within the app context. Returns the timer"""
+        return TimerService.get_instance()._call_at(
+            time.time() + delay, function, *args, **kwargs
+        )
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Returns the count of pending, fired and failed timers"""
+        return TimerService.get_instance()._get_stats()
+
+    # Singleton Wrapper wrapped methods
+    def _call_at(self, when: float, function, *args, **kwargs) -> Timer:
+        timer = Timer(when, function, args, kwargs)
+        heapq.heappush(self.heap, (when, next(self.counter), timer))
+
+        # The background task sleeps until the previous first timer
+        if self.heap[0][2] is timer:
+            self.wakeup.set()
+
+        return timer
+
+    def _get_stats(self) -> dict:
+        return {
+            "pending": len(self.heap) - self.cancelled_count,
+            "fired": self.fired_count,
+            "failed": self.failed_count,
+        }
+
+    def _timer_cancelled(self) -> None:
+        """Removes cancelled timers from the heap if they are the majority,
+        otherwise they are skipped when they are due"""
+        self.cancelled_count += 1
+        if self.cancelled_count > 64 and self.cancelled_count * 2 > len(self.heap):
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled_count = 0
+
+    def run_due(self, now: float) -> int:
+        """Calls the functions of all timers due at now. Returns the count
+        of called timers"""
+        count = 0
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            when, i, timer = heapq.heappop(self.heap)
+            if timer.cancelled:
+                self.cancelled_count -= 1
+                continue
+
+            timer.done = True
+            count += 1
+            try:
+                timer._finished()
+                timer.function(*timer.args, **timer.kwargs)
+            except Exception:
+                self.failed_count += 1
+                getLogger(__name__).exception("Timer %s failed", timer.function)
+
+        self.fired_count += count
+        return count
+
+    def _timer_loop(self) -> None:
+        """Calls the due timers, sleeps until the next timer is due"""
+        while True:
+            if len(self.heap) > 0:
+                timeout = max(0, self.heap[0][0] - time.time())
+            else:
+                timeout = None
+
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+            with self.app.app_context():
+                self.run_due(time.time())
@@ -11,6 +11,10 @@ from flask import current_app
 from logging import getLogger
 
 from playhouse.shortcuts import ReconnectMixin
+from playhouse.pool import PooledMySQLDatabase
+from playhouse.pool import PooledPostgresqlDatabase
+
+import time
 
 
 class ReconnectingMySQLDatabase(ReconnectMixin, MySQLDatabase):
@@ -21,6 +25,69 @@ class ReconnectingPostgresqlDatabase(ReconnectMixin, PostgresqlDatabase):
     pass
 
 
+class PoolStatsMixin(object):
+    """Mixin for pooled databases counting the connections taken from and
+    returned to the pool and measuring the time spent to acquire them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_connections = kwargs.get("max_connections", 20)
+        self.in_use_count = 0  # Connections taken from the pool
+        self.acquired_count = 0
+        self.waited_count = 0  # Acquires that found all connections in use
+        self.wait_time = 0  # Total seconds spent to acquire connections
+        self.max_wait_time = 0
+
+    def connect(self, reuse_if_open=False):
+        if not self.is_closed():
+            return super().connect(reuse_if_open)
+
+        exhausted = self.in_use_count >= self.max_connections
+        start = time.monotonic()
+        result = super().connect(reuse_if_open)
+
+        wait_time = time.monotonic() - start
+        self.in_use_count += 1
+        self.acquired_count += 1
+        self.waited_count += 1 if exhausted else 0
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        return result
+
+    def close(self):
+        if self.is_closed():
+            return super().close()
+
+        try:
+            return super().close()
+        finally:
+            self.in_use_count -= 1
+
+    def get_stats(self) -> dict:
+        """Returns the utilisation of the pool and the acquire times. The
+        count of idle connections is None if the pool does not provide it"""
+        idle = getattr(self, "_connections", None)
+        return {
+            "pooled": True,
+            "max_connections": self.max_connections,
+            "in_use": self.in_use_count,
+            "idle": len(idle) if isinstance(idle, list) else None,
+            "utilisation": self.in_use_count / max(1, self.max_connections),
+            "acquired": self.acquired_count,
+            "waited": self.waited_count,
+            "avg_wait_time": self.wait_time / max(1, self.acquired_count),
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+class PooledStatsMySQLDatabase(PoolStatsMixin, PooledMySQLDatabase):
+    pass
+
+
+class PooledStatsPostgresqlDatabase(PoolStatsMixin, PooledPostgresqlDatabase):
+    pass
+
+
 class Database(object):
     instance = None
 
@@ -36,13 +103,39 @@ class Database(object):
     @staticmethod
     def register_models(*models):
         """Creates tabels for the models in the currently connected
-        database"""
+        database and applies pending migrations to existing tables"""
+        from skirmserv.models.migrations import apply_migrations
+
         db = Database.get()
-        db.create_tables(models)
+        created_models = [
+            model for model in models if not db.table_exists(model._meta.table_name)
+        ]
+        # Existing tables (and their indexes) are only changed by migrations
+        db.create_tables(created_models)
+        apply_migrations(models, created_models)
+
+        # Do not keep a pooled connection outside of a request
+        Database.release()
 
         for model in models:
             getLogger(__name__).debug("Registered table: %s", str(model))
 
+    @staticmethod
+    def release() -> None:
+        """Returns the connection of the current request (or socket event) to
+        the pool. Without pool the connection stays open"""
+        db = Database.get()
+        if isinstance(db, PoolStatsMixin) and not db.is_closed():
+            db.close()
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Returns statistics about the connection pool"""
+        db = Database.get()
+        if isinstance(db, PoolStatsMixin):
+            return db.get_stats()
+        return {"pooled": False}
+
     def __init__(self):
         # Don't override existing instance
         if Database.instance is not None:
@@ -53,7 +146,11 @@ class Database(object):
             getLogger(__name__).info(
                 "SQLite DB Type configured @ " + current_app.config["DB_LOCATION"]
             )
-            self._db = SqliteDatabase(current_app.config["DB_LOCATION"])
+            self._db = SqliteDatabase(
+                current_app.config["DB_LOCATION"],
+                pragmas=self.get_sqlite_pragmas(),
+                timeout=float(current_app.config["DB_SQLITE_BUSY_TIMEOUT"]),
+            )
 
         elif current_app.config["DB_TYPE"] == "mysql":
             getLogger(__name__).info(
@@ -61,13 +158,23 @@ class Database(object):
                     current_app.config["DB_HOST"], current_app.config["DB_DATABASE"]
                 )
             )
-            self._db = ReconnectingMySQLDatabase(
-                current_app.config["DB_DATABASE"],
-                user=current_app.config["DB_USER"],
-                password=current_app.config["DB_PASS"],
-                host=current_app.config["DB_HOST"],
-                port=int(current_app.config.get("DB_PORT", 3306)),
-            )
+            if self.get_max_connections() > 0:
+                self._db = PooledStatsMySQLDatabase(
+                    current_app.config["DB_DATABASE"],
+                    user=current_app.config["DB_USER"],
+                    password=current_app.config["DB_PASS"],
+                    host=current_app.config["DB_HOST"],
+                    port=int(current_app.config.get("DB_PORT", 3306)),
+                    **self.get_pool_options(),
+                )
+            else:
+                self._db = ReconnectingMySQLDatabase(
+                    current_app.config["DB_DATABASE"],
+                    user=current_app.config["DB_USER"],
+                    password=current_app.config["DB_PASS"],
+                    host=current_app.config["DB_HOST"],
+                    port=int(current_app.config.get("DB_PORT", 3306)),
+                )
 
         elif current_app.config["DB_TYPE"] == "postgresql":
             getLogger(__name__).info(
@@ -75,14 +182,52 @@ class Database(object):
                     current_app.config["DB_HOST"], current_app.config["DB_DATABASE"]
                 )
             )
-            self._db = ReconnectingPostgresqlDatabase(
-                current_app.config["DB_DATABASE"],
-                user=current_app.config["DB_USER"],
-                password=current_app.config["DB_PASS"],
-                host=current_app.config["DB_HOST"],
-                port=current_app.config.get("DB_PORT", 5432),
-            )
+            if self.get_max_connections() > 0:
+                self._db = PooledStatsPostgresqlDatabase(
+                    current_app.config["DB_DATABASE"],
+                    user=current_app.config["DB_USER"],
+                    password=current_app.config["DB_PASS"],
+                    host=current_app.config["DB_HOST"],
+                    port=current_app.config.get("DB_PORT", 5432),
+                    **self.get_pool_options(),
+                )
+            else:
+                self._db = ReconnectingPostgresqlDatabase(
+                    current_app.config["DB_DATABASE"],
+                    user=current_app.config["DB_USER"],
+                    password=current_app.config["DB_PASS"],
+                    host=current_app.config["DB_HOST"],
+                    port=current_app.config.get("DB_PORT", 5432),
+                )
 
         else:
             # Remove this instance if no valid DB_TYPE is configured
             Database.instance = None
+
+    def get_max_connections(self) -> int:
+        """Returns the configured size of the connection pool (0 if no pool
+        should be used)"""
+        return int(current_app.config["DB_MAX_CONNECTIONS"])
+
+    def get_pool_options(self) -> dict:
+        """Returns the options of the connection pool from the config"""
+        return {
+            "max_connections": self.get_max_connections(),
+            "stale_timeout": int(current_app.config["DB_STALE_TIMEOUT"]),
+            "timeout": int(current_app.config["DB_POOL_TIMEOUT"]),
+        }
+
+    def get_sqlite_pragmas(self) -> dict:
+        """Returns the pragmas of the configured sqlite profile. The
+        performance profile uses write ahead logging (reads do not wait for
+        writes) and only syncs at checkpoints"""
+        if current_app.config["DB_SQLITE_PROFILE"] != "performance":
+            return {}
+
+        return {
+            "journal_mode": "wal",
+            "synchronous": "normal",
+            "mmap_size": int(current_app.config["DB_SQLITE_MMAP_SIZE"]),
+            # Negative values are the size in KiB instead of pages
+            "cache_size": -int(current_app.config["DB_SQLITE_CACHE_SIZE"]),
+        }
@@ -0,0 +1,89 @@
+"""
+Skirmish Server
+
+Versioned schema migrations. Tables are created by peewee with the current
+schema, changes to the schema of existing tables are applied by migrations
+when the models are registered at startup.
+
+Migrations are registered per model using the migration decorator. They get
+a playhouse SchemaMigrator and return the operations to apply. The version
+of every table is stored in the schemaversion table. Never change or remove a
+released migration, only add new ones with a higher version.
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import peewee
+from playhouse.migrate import SchemaMigrator
+from playhouse.migrate import migrate
+
+from skirmserv.models import Database
+
+from logging import getLogger
+
+# key is the model, value a dict with the version as key and the migration
+# function as value
+_migrations = {}
+
+
+class SchemaVersionModel(peewee.Model):
+    """
+    Database Model to store the schema version of every table
+    """
+
+    table = peewee.CharField(primary_key=True)
+    version = peewee.IntegerField(default=0)
+
+    class Meta:
+        database = Database.get()
+        table_name = "schemaversion"
+
+
+def migration(model, version: int):
+    """Decorator registering a migration of the given model. The migration
+    is applied to tables with a lower version"""
+
+    def register(function):
+        _migrations.setdefault(model, {}).update({version: function})
+        return function
+
+    return register
+
+
+def get_latest_version(model) -> int:
+    """Returns the version of the latest migration of the given model"""
+    return max(_migrations.get(model, {0: None}).keys())
+
+
+def apply_migrations(models, created_models=()) -> None:
+    """Applies all pending migrations of the given models. Tables that were
+    just created already have the current schema, they are only marked with
+    the latest version"""
+    db = Database.get()
+    db.create_tables([SchemaVersionModel])
+    migrator = SchemaMigrator.from_database(db)
+
+    for model in models:
+        table = model._meta.table_name
+        latest = get_latest_version(model)
+
+        schema_version, created = SchemaVersionModel.get_or_create(
+            table=table,
+            defaults={"version": latest if model in created_models else 0},
+        )
+
+        for version, function in sorted(_migrations.get(model, {}).items()):
+            if version <= schema_version.version:
+                continue
+
+            with db.atomic():
+                migrate(*function(migrator))
+                schema_version.version = version
+                schema_version.save()
+
+            getLogger(__name__).info(
+                "Migrated table %s to version %d (%s)",
+                table,
+                version,
+                function.__doc__ or function.__name__,
+            )
@@ -7,14 +7,23 @@ Copyright (C) 2022 Ole Lange
 from __future__ import annotations
 
 import peewee
+from flask import current_app
 from skirmserv.models import Database
+from skirmserv.models.migrations import migration
+from skirmserv.util.cache import TTLCache
+from skirmserv.util.workers import WorkerPool
 
 from logging import getLogger
 
 from argon2 import PasswordHasher  # used for password hashing
+from argon2.exceptions import InvalidHashError, VerificationError
 from hashlib import sha256  # used for token hashing
 
 from secrets import token_urlsafe
+import time
+
+from itsdangerous import URLSafeSerializer  # used for signed tokens
+from itsdangerous import BadSignature
 
 
 class UserModel(peewee.Model):
@@ -22,32 +31,72 @@ class UserModel(peewee.Model):
     Database Model to store User Accounts
     """
 
+    # Cache of the users authenticated by token, key is the token hash. Created
+    # on first use (see get_token_cache)
+    token_cache = None
+
+    # Generations of the valid signed tokens, key is the user id and value a
+    # tuple of the generation and the user (see authenticate_by_signed_token)
+    token_generations = None
+    token_serializer = None
+
+    # Argon2 hasher and the pool the hashing runs in (see get_password_pool)
+    password_hasher = None
+    password_pool = None
+
     # Todo: Check if 32 characters fit good on the phaser screen
     name = peewee.CharField(max_length=32)
-    email = peewee.CharField()
+    email = peewee.CharField(unique=True)
     password = peewee.CharField(default="")
 
     # used as API Key and access_token to authenticate socketio comm
     # this field contains a hash of the token and the user has to save
     # it or re-create the token when lost
-    access_token = peewee.CharField(default="")
+    access_token = peewee.CharField(default="", index=True)
 
     def set_password(self, plaintext_password: str) -> None:
         """Set Password of this user"""
-        ph = PasswordHasher()
-        self.password = ph.hash(plaintext_password)
+        ph = UserModel.get_password_hasher()
+        self.password = UserModel.get_password_pool().run(ph.hash, plaintext_password)
         getLogger(__name__).debug("User %s set password.", str(self))
 
     def generate_access_token(self) -> str:
         """Generates an access_token, stores a hash of it and returns the
-        plaintext value of the token. The token is urlsafe"""
+        plaintext value of the token. The token is urlsafe. If configured, a
+        signed token is generated (see authenticate_by_signed_token)"""
+
+        generations = UserModel.get_token_generations()
+
+        serializer = UserModel.get_token_serializer()
+        if current_app.config["ACCESS_TOKEN_FORMAT"] == "signed" and serializer:
+            # Signed token with a new generation, older tokens are revoked
+            old_generation, user = generations.get(self.id, (0, None))
+            generation = max(time.time_ns() // 1000000, old_generation + 1)
+            plaintext_token = serializer.dumps(
+                {"id": self.id, "n": self.name, "g": generation}
+            )
+            generations.put(self.id, (generation, self))
 
-        # Generating 32-Byte (256 bit) randomness
-        plaintext_token = token_urlsafe(32)
+        else:
+            # Signed tokens of this user are revoked
+            generations.pop(self.id)
 
-        # Store the sha256 hash of it
+            # Generating 32-Byte (256 bit) randomness
+            plaintext_token = token_urlsafe(32)
+
+        # Store the sha256 hash of it. The new token is written before it is
+        # returned, so the old token is revoked in every worker process
+        old_token = self.access_token
         self.access_token = sha256(plaintext_token.encode("ASCII")).hexdigest()
-        self.save()
+        with Database.get().atomic():
+            stored_token = UserModel._write_access_token(self.id, self.access_token)
+
+        # The old token is not valid anymore (this instance may be older than
+        # the stored token)
+        cache = UserModel.get_token_cache()
+        cache.pop(old_token)
+        cache.pop(stored_token)
+        cache.put(self.access_token, self)
 
         getLogger(__name__).debug("Generated new access token for user %s.", str(self))
 
@@ -56,16 +105,40 @@ class UserModel(peewee.Model):
 
     def check_password(self, plaintext_password: str) -> bool:
         """Check password of this user"""
-        ph = PasswordHasher()
+        ph = UserModel.get_password_hasher()
         try:
-            return ph.verify(self.password, plaintext_password)
-        except:
+            UserModel.get_password_pool().run(
+                ph.verify, self.password, plaintext_password
+            )
+        except (VerificationError, InvalidHashError):
             return False
 
+        # Hash the password again if the argon2 parameters were changed, only
+        # the password is written (other fields may be changed but not saved)
+        if ph.check_needs_rehash(self.password):
+            self.set_password(plaintext_password)
+            UserModel.update(password=self.password).where(
+                UserModel.id == self.id
+            ).execute()
+
+        return True
+
     def check_access_token(self, plaintext_token: str) -> bool:
         """Check if the plaintext token is valid"""
         return self.access_token == sha256(plaintext_token.encode("ASCII")).hexdigest()
 
+    def delete_instance(self, *args, **kwargs):
+        """Deletes this user, its token is not valid anymore"""
+        stored_token = (
+            UserModel.select(UserModel.access_token)
+            .where(UserModel.id == self.id)
+            .scalar()
+        )
+        UserModel.get_token_cache().pop(self.access_token)
+        UserModel.get_token_cache().pop(stored_token)
+        UserModel.get_token_generations().pop(self.id)
+        return super().delete_instance(*args, **kwargs)
+
     @staticmethod
     def register(name: str, email: str, plaintext_password: str) -> UserModel:
         """Creates and returns a new user model"""
@@ -96,10 +169,132 @@ class UserModel(peewee.Model):
         if access_token == "":
             return
 
+        # Signed tokens contain dots, random tokens do not
+        if "." in access_token:
+            return UserModel.authenticate_by_signed_token(access_token)
+
         token_hash = sha256(access_token.encode("ASCII")).hexdigest()
+        return UserModel.get_by_token_hash(token_hash)
+
+    @staticmethod
+    def get_by_token_hash(token_hash: str) -> UserModel | None:
+        """Returns an user model based on the given access token hash. Users
+        are cached, only unknown hashes are queried"""
+        cache = UserModel.get_token_cache()
+        user = cache.get(token_hash)
+        if user is not None:
+            return user
+
         user = UserModel.get_or_none(UserModel.access_token == token_hash)
+        if user is not None:
+            cache.put(token_hash, user)
         return user
 
+    @staticmethod
+    def _write_access_token(user_id: int, token_hash: str) -> str:
+        """Writes the token hash of the given user. Returns the hash stored
+        before"""
+        stored_token = (
+            UserModel.select(UserModel.access_token)
+            .where(UserModel.id == user_id)
+            .scalar()
+        )
+        UserModel.update(access_token=token_hash).where(
+            UserModel.id == user_id
+        ).execute()
+        return stored_token
+
+    @staticmethod
+    def get_password_hasher() -> PasswordHasher:
+        """Returns the argon2 hasher using the parameters from the config"""
+        if UserModel.password_hasher is None:
+            UserModel.password_hasher = PasswordHasher(
+                time_cost=int(current_app.config["ARGON2_TIME_COST"]),
+                memory_cost=int(current_app.config["ARGON2_MEMORY_COST"]),
+                parallelism=int(current_app.config["ARGON2_PARALLELISM"]),
+            )
+        return UserModel.password_hasher
+
+    @staticmethod
+    def get_password_pool() -> WorkerPool:
+        """Returns the pool passwords are hashed and verified in. Hashing is
+        slow by design, it must not block the other greenlets"""
+        if UserModel.password_pool is None:
+            UserModel.password_pool = WorkerPool(
+                int(current_app.config["PASSWORD_POOL_SIZE"]),
+                current_app.extensions["socketio"].async_mode,
+            )
+        return UserModel.password_pool
+
+    @staticmethod
+    def authenticate_by_signed_token(access_token: str) -> UserModel | None:
+        """Returns an user model based on the given signed access token. The
+        signature is checked using the SECRET_KEY, the generation in the token
+        has to be the generation of the last token generated for this user.
+
+        The generations are stored in memory. If the generation of the user
+        is unknown (e.g. after a restart), the token is checked against the
+        hash in the database once."""
+        serializer = UserModel.get_token_serializer()
+        if serializer is None:
+            return None
+
+        try:
+            payload = serializer.loads(access_token)
+            user_id = payload["id"]
+            generation = payload["g"]
+        except (BadSignature, TypeError, KeyError):
+            return None
+
+        generations = UserModel.get_token_generations()
+        entry = generations.get(user_id, None)
+        if entry is not None:
+            valid_generation, user = entry
+            return user if generation == valid_generation else None
+
+        # Unknown generation, only valid if it is the stored token
+        token_hash = sha256(access_token.encode("ASCII")).hexdigest()
+        user = UserModel.get_by_token_hash(token_hash)
+        if user is None or user.id != user_id:
+            return None
+
+        generations.put(user.id, (generation, user))
+        return user
+
+    @staticmethod
+    def get_token_generations() -> TTLCache:
+        """Returns the table of the valid signed token generations. Its size
+        and time to live are read from the config"""
+        if UserModel.token_generations is None:
+            UserModel.token_generations = TTLCache(
+                int(current_app.config["TOKEN_GENERATIONS_SIZE"]),
+                float(current_app.config["TOKEN_GENERATIONS_TTL"]),
+            )
+        return UserModel.token_generations
+
+    @staticmethod
+    def get_token_serializer() -> URLSafeSerializer | None:
+        """Returns the serializer signing the access tokens or None if there
+        is no SECRET_KEY configured"""
+        if UserModel.token_serializer is None:
+            if current_app.config["SECRET_KEY"] == "":
+                return None
+            UserModel.token_serializer = URLSafeSerializer(
+                current_app.config["SECRET_KEY"], salt="skirmserv-access-token"
+            )
+        return UserModel.token_serializer
+
+    @staticmethod
+    def get_token_cache() -> TTLCache:
+        """Returns the cache of the users authenticated by token. Its size and
+        time to live are read from the config"""
+        if UserModel.token_cache is None:
+            UserModel.token_cache = TTLCache(
+                int(current_app.config["TOKEN_CACHE_SIZE"]),
+                float(current_app.config["TOKEN_CACHE_TTL"]),
+            )
+        return UserModel.token_cache
+
     def __str__(self):
         return "{0} ({1})".format(self.name, self.id)
 
@@ -107,5 +302,14 @@ class UserModel(peewee.Model):
         database = Database.get()
 
 
+@migration(UserModel, 1)
+def add_user_indexes(migrator):
+    """Add indexes on email (unique) and access_token"""
+    return [
+        migrator.add_index("usermodel", ("email",), True),
+        migrator.add_index("usermodel", ("access_token",), False),
+    ]
+
+
 # Creating the table directly on import
 Database.register_models(UserModel)
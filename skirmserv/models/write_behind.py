@@ -0,0 +1,188 @@
+"""
+Skirmish Server
+
+Write-behind queue for database writes that do not have to be done before
+the request (or socket event) is answered, like statistics. The queued
+writes are done in one transaction DB_WRITE_INTERVAL ms after the first one
+was queued or when DB_WRITE_BATCH_SIZE writes are queued, and when the
+server shuts down. Nothing is done while no write is queued.
+
+Every write returns a WriteFuture, callers that need to read their write
+call its result method (which writes all queued writes if it is not done
+yet). With DB_WRITE_BEHIND=sync every write is done directly.
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from flask import current_app
+
+import atexit
+import threading
+
+from skirmserv.models import Database
+
+from logging import getLogger
+
+
+class WriteFuture(object):
+    """Result of a queued write"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def result(self):
+        """Returns the result of the write, the queued writes are written
+        first if this write is not done yet. Raises the exception of the
+        write if it failed"""
+        if not self.done:
+            self.queue.flush()
+
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _set_result(self, value=None, error=None) -> None:
+        self.value = value
+        self.error = error
+        self.done = True
+
+
+class WriteBehindQueue(object):
+    instance = None
+
+    @staticmethod
+    def get_instance():
+        """Returns the current instance of this class, if there is no
+        instance of this class a new one is created (using the config of the
+        current app) and returned"""
+        if WriteBehindQueue.instance is not None:
+            return WriteBehindQueue.instance
+        else:
+            WriteBehindQueue()
+            return WriteBehindQueue.instance
+
+    def __init__(self):
+        if WriteBehindQueue.instance is not None:
+            # Create a new instance only if there is no existing
+            return
+        WriteBehindQueue.instance = self
+
+        self.sync = current_app.config["DB_WRITE_BEHIND"] == "sync"
+        self.interval = float(current_app.config["DB_WRITE_INTERVAL"]) / 1000
+        self.batch_size = int(current_app.config["DB_WRITE_BATCH_SIZE"])
+        self.socketio = current_app.extensions["socketio"]
+
+        self.pending = []  # (future, function, args, kwargs) tuples
+        self.lock = threading.Lock()
+        self.flushing = False  # If a background flush is scheduled
+
+        # Set to wake up the background task when a write is queued
+        self.wakeup = self.socketio.server.eio.create_event()
+
+        self.written_count = 0
+        self.failed_count = 0
+        self.flush_count = 0
+
+        if not self.sync:
+            atexit.register(self.flush)
+            self.socketio.start_background_task(self._flush_loop)
+
+    # Singleton Wrapper methods
+    @staticmethod
+    def put(function, *args, **kwargs) -> WriteFuture:
+        """Queues a write, the function is called with the given arguments
+        within a transaction. Returns a future of its result"""
+        return WriteBehindQueue.get_instance()._put(function, *args, **kwargs)
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Returns the count of queued, written and failed writes"""
+        return WriteBehindQueue.get_instance()._get_stats()
+
+    # Singleton Wrapper wrapped methods
+    def _put(self, function, *args, **kwargs) -> WriteFuture:
+        future = WriteFuture(self)
+        self.pending.append((future, function, args, kwargs))
+
+        if self.sync:
+            self.flush()
+
+        # Write a full batch now instead of waiting for the interval
+        elif len(self.pending) >= self.batch_size and not self.flushing:
+            self.flushing = True
+            self.socketio.start_background_task(self.flush)
+
+        # The interval starts with the first queued write
+        elif len(self.pending) == 1:
+            self.wakeup.set()
+
+        return future
+
+    def _get_stats(self) -> dict:
+        return {
+            "queued": len(self.pending),
+            "written": self.written_count,
+            "failed": self.failed_count,
+            "flushes": self.flush_count,
+        }
+
+    def flush(self) -> None:
+        """Writes all queued writes in one transaction. Every write has its
+        own savepoint, a failed write does not undo the others"""
+        with self.lock:
+            self.flushing = False
+            pending, self.pending = self.pending, []
+            if len(pending) == 0:
+                return
+
+            db = Database.get()
+            try:
+                with db.atomic():
+                    results = [self._write(db, *write) for write in pending]
+            except Exception as e:
+                # The transaction failed, none of the writes is done
+                getLogger(__name__).exception("Writing queued writes failed")
+                results = [(None, e) for write in pending]
+
+            for (future, function, args, kwargs), result in zip(pending, results):
+                future._set_result(*result)
+                if result[1] is None:
+                    self.written_count += 1
+                else:
+                    self.failed_count += 1
+
+            self.flush_count += 1
+
+        getLogger(__name__).debug("Wrote %d queued writes", len(pending))
+
+    def _write(self, db, future, function, args, kwargs) -> tuple:
+        """Calls the write function in a savepoint. Returns a tuple of the
+        result and the exception (or None)"""
+        try:
+            with db.atomic():
+                return function(*args, **kwargs), None
+        except Exception as e:
+            getLogger(__name__).exception("Queued write failed")
+            return None, e
+
+    def _flush_loop(self) -> None:
+        """Writes the queued writes an interval after the first one was
+        queued, sleeps while nothing is queued"""
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+
+            self.socketio.sleep(self.interval)
+            if len(self.pending) == 0:
+                continue
+
+            try:
+                self.flush()
+            except Exception:
+                getLogger(__name__).exception("Writing queued writes failed")
+            finally:
+                # Do not keep a pooled connection between the flushes
+                Database.release()
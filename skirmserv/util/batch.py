@@ -0,0 +1,58 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from contextlib import contextmanager
+import threading
+
+# The pending updates of the currently running batch. Stored thread local
+# (greenlet local when gevent is used) as every event is handled on its own
+_local = threading.local()
+
+
+@contextmanager
+def batch_updates():
+    """Collects all updates requested within this context and calls the
+    update method of every object (clients, spectators) exactly once when
+    the outermost context is left. Nested contexts are part of the outer
+    batch."""
+
+    # Nested batch, the outer one sends the updates
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+
+    # key is the object to update, value if a full update was requested
+    pending = {}
+    _local.pending = pending
+    try:
+        yield
+    finally:
+        _local.pending = None
+        for obj, full in pending.items():
+            obj.update(full=full)
+
+
+def defer_update(obj, full: bool = False) -> bool:
+    """Defers the update of the given object to the end of the current batch.
+    Returns False if there is no batch running, the object has to be updated
+    directly then"""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        return False
+
+    pending.update({obj: pending.get(obj, False) or full})
+    return True
+
+
+def pop_deferred_update(obj) -> bool | None:
+    """Removes the deferred update of the given object from the current batch.
+    Returns if a full update was requested or None if there is no update
+    deferred for this object"""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        return None
+
+    return pending.pop(obj, None)
@@ -0,0 +1,70 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from collections import OrderedDict
+import time
+
+
+class TTLCache(object):
+    """Cache with a maximum size and a time to live for every entry. If the
+    cache is full the least recently used entry is removed."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key is the key, value (expires, value)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Returns the value stored for the given key or default if there is
+        no valid entry"""
+        entry = self.entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires, value = entry
+        if expires < time.monotonic():
+            self.entries.pop(key)
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        """Stores the value for the given key"""
+        if self.size <= 0:
+            return
+
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        """Removes the entry of the given key (if there is one)"""
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all entries"""
+        self.entries.clear()
+
+    def get_stats(self) -> dict:
+        """Returns the size and the hit/miss counters of this cache"""
+        return {
+            "size": len(self.entries),
+            "max_size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self):
+        return len(self.entries)
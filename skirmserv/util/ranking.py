@@ -0,0 +1,96 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from bisect import bisect_left, insort
+
+
+class RankIndex(object):
+    """Keeps items (players or teams) ordered by their points to look up
+    ranks without sorting all items on every call.
+
+    Items with the same points are ranked in reverse order of adding them,
+    the item added last gets the better rank. The methods changing the index
+    return the items whose rank changed by it."""
+
+    def __init__(self):
+        self._keys = []  # sorted list of keys, the first key has rank 1
+        self._items = {}  # key is the sort key, value the item
+        self._key_of = {}  # key is the item, value the sort key
+        self._added = 0  # counter to order items with same points
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, item):
+        return item in self._key_of
+
+    def add(self, item, points: int) -> list:
+        """Adds the given item with the given points"""
+        self._added += 1
+        key = (-points, -self._added)
+
+        insort(self._keys, key)
+        self._items.update({key: item})
+        self._key_of.update({item: key})
+
+        # The new item and all items behind it changed their rank
+        index = bisect_left(self._keys, key)
+        return [self._items[k] for k in self._keys[index:]]
+
+    def remove(self, item) -> list:
+        """Removes the given item"""
+        key = self._key_of.pop(item, None)
+        if key is None:
+            return []
+
+        index = bisect_left(self._keys, key)
+        del self._keys[index]
+        self._items.pop(key)
+
+        # All items behind the removed one changed their rank
+        return [self._items[k] for k in self._keys[index:]]
+
+    def update(self, item, points: int) -> list:
+        """Updates the points of the given item"""
+        old_key = self._key_of.get(item, None)
+        if old_key is None:
+            return []
+
+        new_key = (-points, old_key[1])
+        if new_key == old_key:
+            return []
+
+        old_index = bisect_left(self._keys, old_key)
+        del self._keys[old_index]
+        insort(self._keys, new_key)
+        new_index = bisect_left(self._keys, new_key)
+
+        self._items.pop(old_key)
+        self._items.update({new_key: item})
+        self._key_of.update({item: new_key})
+
+        # Only items between the old and the new position changed their rank
+        start, end = sorted((old_index, new_index))
+        return [self._items[k] for k in self._keys[start : end + 1]]
+
+    def get_rank(self, item) -> int:
+        """Returns the rank of the given item, -1 if it is not part of
+        this index"""
+        key = self._key_of.get(item, None)
+        if key is None:
+            return -1
+
+        return bisect_left(self._keys, key) + 1
+
+    def get_ranks(self) -> dict:
+        """Returns a dict containing the rank (value) of every item (key)"""
+        return {self._items[key]: i + 1 for i, key in enumerate(self._keys)}
+
+    def clear(self) -> None:
+        """Removes all items"""
+        self._keys.clear()
+        self._items.clear()
+        self._key_of.clear()
@@ -0,0 +1,52 @@
+"""
+Skirmish Server
+
+JSON serializer used for all messages and API responses. Uses orjson if it is
+installed and falls back to the json module of the standard library.
+
+This module can also be passed as json module to socket.io, options of the
+standard json module (like separators) are ignored.
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    backend = "orjson"
+
+    def dumps(obj, **kwargs) -> str:
+        """Serializes the given object to a JSON string"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(s, **kwargs):
+        """Deserializes the given JSON string"""
+        return orjson.loads(s)
+
+else:
+    backend = "json"
+
+    def dumps(obj, **kwargs) -> str:
+        """Serializes the given object to a JSON string"""
+        return json.dumps(obj, separators=(",", ":"))
+
+    def loads(s, **kwargs):
+        """Deserializes the given JSON string"""
+        return json.loads(s)
+
+
+class lazy_dumps(object):
+    """Serializes the given object only when it is converted to a string.
+    Used for log messages that are not emitted most of the time"""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return dumps(self.obj)
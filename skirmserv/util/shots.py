@@ -0,0 +1,116 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import sys
+
+
+class ShotWindow(object):
+    """Remembers which players were hit by the last size shots of one
+    shooter. Shot ids (sid) are counted up by the phaser and wrap around at
+    id_range, a sid that is more than half of id_range ahead is older.
+
+    Every slot of the window holds the set of pids hit by that shot (or None
+    if it hit nobody), so the memory used depends on the size and the hits
+    but not on the pids. A sid older than the window (like a late packet) is
+    reported as already hit, it must not move the window back."""
+
+    def __init__(self, size: int = 256, id_range: int = 65536):
+        self.size = size
+        self.id_range = id_range
+
+        self.newest = None  # newest sid seen
+        self.position = 0  # slot index of the newest sid (not wrapped)
+        self.hits = [None] * size  # key is the slot, value the set of pids
+
+    def hit(self, sid: int, pid: int) -> bool:
+        """Marks the shot as hit on the player with the given pid. Returns
+        True if this shot has already hit the player before or is older
+        than the window"""
+        sid %= self.id_range
+        if self.newest is None:
+            self.newest = sid
+
+        behind = (self.newest - sid) % self.id_range
+        if behind > self.id_range // 2:
+            # Newer shot, the window is moved forward to it
+            self._advance(self.id_range - behind)
+            self.newest = sid
+            behind = 0
+
+        elif behind >= self.size:
+            # Too old to be known, do not count it again
+            return True
+
+        slot = (self.position - behind) % self.size
+        hits = self.hits[slot]
+        if hits is None:
+            self.hits[slot] = {pid}
+            return False
+        if pid in hits:
+            return True
+        hits.add(pid)
+        return False
+
+    def forget(self, pid: int) -> None:
+        """Removes the player with the given pid from all slots"""
+        for hits in self.hits:
+            if hits is not None:
+                hits.discard(pid)
+
+    def clear(self) -> None:
+        self.hits = [None] * self.size
+
+    def get_memory_estimate(self) -> int:
+        """Returns the bytes used by this window"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.hits)
+        return size + sum(sys.getsizeof(hits) for hits in self.hits if hits)
+
+    def _advance(self, count: int) -> None:
+        """Moves the window forward by count shots, the slots of the new
+        shots are cleared"""
+        if count >= self.size:
+            self.clear()
+        else:
+            for i in range(1, count + 1):
+                self.hits[(self.position + i) % self.size] = None
+        self.position = (self.position + count) % self.size
+
+
+class ShotStore(object):
+    """Deduplicates hits of shots within a game. Every shooter has its own
+    ShotWindow, a shot may hit multiple players but every player only once"""
+
+    def __init__(self, size: int = 256, id_range: int = 65536):
+        self.size = size
+        self.id_range = id_range
+        self._windows = {}  # key is the pid of the shooter, value its window
+
+    def __len__(self):
+        return len(self._windows)
+
+    def hit(self, shooter: int, sid: int, pid: int) -> bool:
+        """Marks the shot sid of the shooter as hit on the player with the
+        given pid. Returns True if it has already hit the player before"""
+        window = self._windows.get(shooter, None)
+        if window is None:
+            window = ShotWindow(self.size, self.id_range)
+            self._windows.update({shooter: window})
+        return window.hit(sid, pid)
+
+    def remove(self, pid: int) -> None:
+        """Forgets the shots of and hits on the player with the given pid,
+        the pid may be used by a new player"""
+        self._windows.pop(pid, None)
+        for window in self._windows.values():
+            window.forget(pid)
+
+    def clear(self) -> None:
+        self._windows.clear()
+
+    def get_memory_estimate(self) -> int:
+        """Returns the bytes used by the windows of all players"""
+        size = sys.getsizeof(self._windows)
+        return size + sum(w.get_memory_estimate() for w in self._windows.values())
@@ -0,0 +1,23 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+
+def percentiles(samples, points=(50, 90, 99)) -> dict:
+    """Returns the given percentiles (nearest rank) of the samples as dict
+    like {"p50": ..., "p90": ...}. The values are None if there are no
+    samples"""
+    ordered = sorted(samples)
+
+    result = {}
+    for point in points:
+        if len(ordered) == 0:
+            value = None
+        else:
+            index = max(0, -(-point * len(ordered) // 100) - 1)
+            value = ordered[index]
+        result.update({"p{0}".format(point): value})
+
+    return result
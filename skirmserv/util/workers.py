@@ -0,0 +1,69 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _call(function, args, kwargs) -> tuple:
+    """Calls the function and returns a tuple of the raised exception (or
+    None) and the result"""
+    try:
+        return None, function(*args, **kwargs)
+    except Exception as e:
+        return e, None
+
+
+class WorkerPool(object):
+    """Runs CPU heavy functions (like password hashing) in a bounded pool of
+    native threads. The calling greenlet waits for the result, the other
+    greenlets of the worker (e.g. websockets) keep running meanwhile.
+
+    The pool depends on the async mode of socket.io: gevent and eventlet
+    provide their own thread pools, otherwise a ThreadPoolExecutor is used.
+    With a size of 0 the functions are called directly."""
+
+    def __init__(self, size: int, async_mode: str = "threading"):
+        self.size = size
+        self.async_mode = async_mode
+        self.pool = None  # Created on first use
+
+    def run(self, function, *args, **kwargs):
+        """Calls the function with the given arguments in the pool and
+        returns its result (exceptions are raised in the calling greenlet)"""
+        if self.size <= 0:
+            return function(*args, **kwargs)
+
+        if self.pool is None:
+            self.pool = self._create_pool()
+
+        if self.async_mode.startswith("gevent"):
+            # gevent prints exceptions raised in its pool, they are passed to
+            # the calling greenlet instead
+            error, result = self.pool.apply(_call, (function, args, kwargs))
+            if error is not None:
+                raise error
+            return result
+
+        if self.async_mode == "eventlet":
+            return self.pool.execute(function, *args, **kwargs)
+
+        return self.pool.submit(function, *args, **kwargs).result()
+
+    def _create_pool(self):
+        """Creates the thread pool for the async mode"""
+        if self.async_mode.startswith("gevent"):
+            from gevent.threadpool import ThreadPool
+
+            return ThreadPool(self.size)
+
+        if self.async_mode == "eventlet":
+            from eventlet import tpool
+
+            # The pool of eventlet is global, it can only be resized once
+            tpool.set_num_threads(self.size)
+            return tpool
+
+        return ThreadPoolExecutor(self.size, thread_name_prefix="skirmserv-worker")
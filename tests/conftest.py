@@ -0,0 +1,105 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# Importing skirmserv initializes the app, the tests use a throw-away
+# database and fast password hashing
+os.environ.setdefault("DB_LOCATION", ":memory:")
+os.environ.setdefault("ARGON2_TIME_COST", "1")
+os.environ.setdefault("ARGON2_MEMORY_COST", "1024")
+os.environ.setdefault("ARGON2_PARALLELISM", "1")
+
+
+@pytest.fixture
+def app():
+    """Returns the app within its app context"""
+    from skirmserv import app
+
+    with app.app_context():
+        yield app
+
+
+class FakeEngineIO(object):
+    def create_event(self):
+        return threading.Event()
+
+
+class FakeServer(object):
+    def __init__(self):
+        self.eio = FakeEngineIO()
+        self.disconnected = []
+        self.rooms = {}  # key is the room, value the set of sockets in it
+
+    def disconnect(self, sid, namespace="/"):
+        self.disconnected.append(sid)
+
+    def enter_room(self, sid, room, namespace="/"):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    def leave_room(self, sid, room, namespace="/"):
+        self.rooms.get(room, set()).discard(sid)
+
+
+class FakeSocketIO(object):
+    """Records the emitted messages, background tasks are run by the test"""
+
+    def __init__(self):
+        self.server = FakeServer()
+        self.emitted = []  # (event, data, callback) tuples
+        self.tasks = []
+        self.on_sleep = None
+
+    def emit(self, event, data, to=None, callback=None):
+        self.emitted.append((event, json.loads(data), callback))
+
+    def start_background_task(self, function, *args):
+        self.tasks.append((function, args))
+
+    def sleep(self, seconds):
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+    def run_tasks(self):
+        while len(self.tasks) > 0:
+            function, args = self.tasks.pop(0)
+            function(*args)
+
+    def acknowledge(self, count=None):
+        """Calls the callbacks of the emitted messages"""
+        for event, data, callback in self.emitted[:count]:
+            if callback is not None:
+                callback()
+
+
+@pytest.fixture
+def socketio():
+    """Returns a fake socketio server recording the emitted messages"""
+    return FakeSocketIO()
+
+
+@pytest.fixture
+def timers(app, monkeypatch, socketio):
+    """Returns a new timer service, the timer loop is not run (the tests call
+    run_due)"""
+    from skirmserv.game.timer_service import TimerService
+
+    monkeypatch.setitem(app.extensions, "socketio", socketio)
+    monkeypatch.setattr(TimerService, "instance", None)
+    return TimerService.get_instance()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Server clock set by the test, in seconds"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr("time.time", lambda: clock.now)
+    return clock
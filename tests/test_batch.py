@@ -0,0 +1,75 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.util.batch import batch_updates, defer_update, pop_deferred_update
+
+
+class Updatable(object):
+    def __init__(self):
+        self.updates = []
+
+    def update(self, full: bool = False) -> None:
+        self.updates.append(full)
+
+
+def test_no_batch_updates_directly():
+    assert defer_update(Updatable()) is False
+    assert pop_deferred_update(Updatable()) is None
+
+
+def test_updates_once_per_batch():
+    a = Updatable()
+    b = Updatable()
+    with batch_updates():
+        assert defer_update(a)
+        assert defer_update(a)
+        assert defer_update(b, full=True)
+        assert a.updates == [] and b.updates == []
+
+    assert a.updates == [False]
+    assert b.updates == [True]
+
+
+def test_full_update_wins():
+    a = Updatable()
+    with batch_updates():
+        defer_update(a, full=True)
+        defer_update(a)
+
+    assert a.updates == [True]
+
+
+def test_nested_batch_sends_at_outer_end():
+    a = Updatable()
+    with batch_updates():
+        with batch_updates():
+            defer_update(a)
+        assert a.updates == []
+
+    assert a.updates == [False]
+
+
+def test_pop_deferred_update():
+    a = Updatable()
+    with batch_updates():
+        defer_update(a, full=True)
+        assert pop_deferred_update(a) is True
+        assert pop_deferred_update(a) is None
+
+    assert a.updates == []
+
+
+def test_updates_sent_on_exception():
+    a = Updatable()
+    try:
+        with batch_updates():
+            defer_update(a)
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert a.updates == [False]
+    assert defer_update(a) is False
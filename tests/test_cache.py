@@ -0,0 +1,82 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import pytest
+
+from skirmserv.util import cache as cache_module
+from skirmserv.util.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the clock of the cache, returns a list holding the time"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_and_put(clock):
+    cache = TTLCache(2, 10)
+    cache.put("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b", "default") == "default"
+    assert cache.get_stats() == {"size": 1, "max_size": 2, "hits": 1, "misses": 1}
+
+
+def test_entries_expire(clock):
+    cache = TTLCache(2, 10)
+    cache.put("a", 1)
+
+    clock[0] += 10
+    assert cache.get("a") == 1
+
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_put_renews_ttl(clock):
+    cache = TTLCache(2, 10)
+    cache.put("a", 1)
+    clock[0] += 8
+    cache.put("a", 2)
+    clock[0] += 8
+
+    assert cache.get("a") == 2
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(2, 10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_pop_and_clear(clock):
+    cache = TTLCache(2, 10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    cache.pop("a")
+    cache.pop("unknown")
+    assert cache.get("a") is None
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = TTLCache(0, 10)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
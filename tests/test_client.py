@@ -0,0 +1,96 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from skirmserv.communication.client import SocketClient
+from skirmserv.game.game import Game
+from skirmserv.gamemodes import Deathmatch
+
+TIMESYNC = SocketClient.ACTION_TIMESYNC
+
+
+@pytest.fixture
+def client(app, socketio):
+    """Returns a client connected to the fake socketio server"""
+    return SocketClient("sid", SimpleNamespace(name="Phaser"), socketio)
+
+
+def messages(socketio):
+    return [data for event, data, callback in socketio.emitted]
+
+
+def test_timesync_request_is_not_queued(client, socketio, clock):
+    client.outbound.connect(ack=True)
+    client.outbound.in_flight = client.outbound.max_in_flight
+
+    client._on_timesync({})
+    assert messages(socketio) == [{"a": [TIMESYNC], "ts": 1000000}]
+    assert client.outbound.get_depth() == 0
+
+
+def test_timesync_measures_rtt_and_offset(client, socketio, clock):
+    client._on_timesync({})
+
+    # The client clock is 5 seconds ahead, its time is taken in the middle
+    # of the round trip
+    clock.now = 1000.2
+    client._on_timesync({"ts": 1000000, "tc": 1005100})
+
+    assert client.rtt == pytest.approx(0.2)
+    assert client._timesync_samples[0][1] == pytest.approx(5.0)
+
+    # A new request is sent after every echo
+    assert messages(socketio)[-1] == {"a": [TIMESYNC], "ts": 1000200}
+
+
+def test_timesync_uses_sample_with_lowest_rtt(
+    app, monkeypatch, client, socketio, clock
+):
+    monkeypatch.setitem(app.config, "TIMESYNC_SAMPLES", 3)
+    client._on_timesync({})
+
+    # (rtt, offset) samples in milliseconds
+    for rtt, offset in ((300, 7000), (100, 5000), (200, 6000)):
+        ts = int(clock.now * 1000)
+        clock.now += rtt / 1000
+        client._on_timesync({"ts": ts, "tc": ts + rtt // 2 + offset})
+
+    assert client.clock_offset == pytest.approx(5.0)
+    assert client._timesync_samples == []
+    assert len(client.rtt_samples) == 3
+
+    # No request after the last sample
+    requests = [m for m in messages(socketio) if m.get("ts", None) is not None]
+    assert len(requests) == 3
+
+
+def test_timesync_ignores_echos_of_unsent_requests(client, clock):
+    client._on_timesync({"ts": 2000000, "tc": 2000000})
+    client._on_timesync({"ts": "1000", "tc": 1000000})
+
+    assert client.rtt is None
+    assert client._timesync_samples == []
+
+
+def test_timestamps_are_corrected_by_clock_offset(client, socketio, clock):
+    game = Game(Deathmatch, "timesync", SimpleNamespace(name="Phaser"))
+    game.start_time = 1100
+    client.set_game(game)
+    client.clock_offset = 5.4
+
+    client.update(full=True)
+    data = messages(socketio)[-1]
+    assert data["g_ca"] == 1005
+    assert data["g_st"] == 1105
+
+    # Unset timestamps stay unset
+    game.start_time = 0
+    game.mark_changed("start_time")
+    client.update()
+    assert messages(socketio)[-1]["g_st"] == 0
@@ -0,0 +1,197 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import itertools
+
+import pytest
+
+from skirmserv.communication.client import SocketClient
+from skirmserv.communication.client_manager import ClientManager
+from skirmserv.game.game_manager import GameManager
+from skirmserv.models.user import UserModel
+
+FULL_DATA_UPDATE = SocketClient.ACTION_FULL_DATA_UPDATE
+
+user_ids = itertools.count()
+
+
+@pytest.fixture
+def manager(app, monkeypatch, socketio):
+    """Returns a new client manager using the fake socketio server"""
+    monkeypatch.setattr(ClientManager, "instance", None)
+    monkeypatch.setattr(GameManager, "instance", None)
+    manager = ClientManager.get_instance()
+    manager.socketio = socketio
+    return manager
+
+
+def register(name: str) -> str:
+    """Registers a new user, returns its access token"""
+    i = next(user_ids)
+    user = UserModel.register(name, "{0}{1}@example.com".format(name, i), "secret")
+    return user.generate_access_token()
+
+
+def join_game(client: SocketClient) -> None:
+    gid = GameManager.create_game("deathmatch", client.user)
+    GameManager.join_game(GameManager.get_game(gid), client)
+
+
+def messages(socketio):
+    return [data for event, data, callback in socketio.emitted]
+
+
+def send_messages(client: SocketClient, count: int) -> None:
+    for i in range(count):
+        client.trigger_action(SocketClient.ACTION_TIMESYNC)
+        client.update()
+
+
+def test_rejoin_replays_missed_messages(manager, socketio):
+    token = register("resume")
+    client = ClientManager.join_client(token, "s1")
+    join_game(client)
+    send_messages(client, 3)
+    seq = client.seq
+
+    # The connection is lost before the last messages arrive
+    manager._detach_client(client)
+    send_messages(client, 2)
+
+    socketio.emitted.clear()
+    assert ClientManager.join_client(token, "s2", seq=seq - 1) is client
+
+    replayed = messages(socketio)
+    assert [m["seq"] for m in replayed] == [seq, seq + 1, seq + 2]
+    assert replayed == list(client.replay_buffer)[-3:]
+    assert FULL_DATA_UPDATE not in replayed[0]["a"]
+
+
+@pytest.mark.parametrize(
+    "case",
+    ["left_buffer", "newer", "negative"],
+)
+def test_rejoin_sends_full_update(app, monkeypatch, manager, socketio, case):
+    monkeypatch.setitem(app.config, "REPLAY_BUFFER_SIZE", 4)
+    token = register("full")
+    client = ClientManager.join_client(token, "s1")
+    join_game(client)
+    send_messages(client, 8)
+    manager._detach_client(client)
+
+    seq = {"left_buffer": 2, "newer": client.seq + 1, "negative": -1}[case]
+    assert not client.can_replay(seq)
+
+    socketio.emitted.clear()
+    ClientManager.join_client(token, "s2", seq=seq)
+
+    full = messages(socketio)
+    assert len(full) == 1
+    assert FULL_DATA_UPDATE in full[0]["a"]
+    assert full[0]["p_id"] == client.player.pid
+    assert full[0]["seq"] == client.seq
+
+
+def test_can_replay(app, monkeypatch, socketio):
+    monkeypatch.setitem(app.config, "REPLAY_BUFFER_SIZE", 2)
+    client = SocketClient("sid", UserModel(name="Phaser"), socketio)
+    send_messages(client, 5)
+
+    # Messages 4 and 5 are in the buffer
+    assert client.can_replay(5)
+    assert client.can_replay(3)
+    assert not client.can_replay(2)
+    assert not client.can_replay(6)
+    assert not client.can_replay(-1)
+
+
+def test_reaper_removes_disconnected_clients(manager, socketio):
+    client = ClientManager.join_client(register("left"), "s1")
+    join_game(client)
+    game = client.game
+    player = client.player
+    manager._detach_client(client)
+    client.connection_closed -= manager.idle_timeout + 1
+
+    assert ClientManager.reap_clients() == {"clients": 1, "players": 1}
+    assert client.user.id not in manager.clients_by_user
+    assert player.pid not in game.players
+    assert client.game is None
+    assert socketio.server.disconnected == []
+
+
+def test_reaper_disconnects_silent_clients(manager, socketio):
+    client = ClientManager.join_client(register("silent"), "s1")
+    client.last_seen -= manager.idle_timeout + 1
+
+    assert ClientManager.reap_clients() == {"clients": 1, "players": 0}
+    assert socketio.server.disconnected == ["s1"]
+    assert manager.clients == {}
+    assert manager.clients_by_user == {}
+
+
+def test_reaper_keeps_active_clients(manager, socketio):
+    client = ClientManager.join_client(register("active"), "s1")
+    join_game(client)
+    manager._detach_client(client)
+    other = ClientManager.join_client(register("other"), "s2")
+    other.last_seen -= manager.idle_timeout - 10
+
+    assert ClientManager.reap_clients() == {"clients": 0, "players": 0}
+    assert manager.clients_by_user == {client.user.id: client, other.user.id: other}
+    assert client.player.pid in client.game.players
+    assert socketio.server.disconnected == []
+
+
+def assert_consistent(manager: ClientManager) -> None:
+    """Every socket belongs to the client of its user and every connected
+    client is found by its socket"""
+    for socket_id, client in manager.clients.items():
+        assert client.socket_id == socket_id
+        assert manager.clients_by_user[client.user.id] is client
+
+    for client in manager.clients_by_user.values():
+        if client.socket_id is not None:
+            assert manager.clients[client.socket_id] is client
+
+
+def test_join_from_second_socket(manager):
+    token = register("twice")
+    client = ClientManager.join_client(token, "s1")
+
+    assert ClientManager.join_client(token, "s2") is client
+    assert manager.clients == {"s2": client}
+    assert client.connection_closed == 0
+    assert_consistent(manager)
+
+
+def test_other_user_takes_over_socket(manager):
+    first = ClientManager.join_client(register("first"), "s1")
+    second = ClientManager.join_client(register("second"), "s1")
+
+    assert manager.clients == {"s1": second}
+    assert first.socket_id is None
+    assert first.connection_closed > 0
+
+    # The first user can still rejoin
+    assert manager.clients_by_user[first.user.id] is first
+    assert_consistent(manager)
+
+
+def test_disconnect_and_rejoin(manager):
+    token = register("rejoin")
+    client = ClientManager.join_client(token, "s1")
+
+    manager._detach_client(client)
+    assert manager.clients == {}
+    assert client.connection_closed > 0
+    assert_consistent(manager)
+
+    assert ClientManager.join_client(token, "s2") is client
+    assert manager.clients == {"s2": client}
+    assert client.connection_closed == 0
+    assert len(manager.clients_by_user) == 1
+    assert_consistent(manager)
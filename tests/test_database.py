@@ -0,0 +1,97 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import threading
+
+from playhouse.pool import PooledSqliteDatabase
+
+from skirmserv.models import PoolStatsMixin
+from skirmserv.models import PooledStatsMySQLDatabase
+from skirmserv.models import PooledStatsPostgresqlDatabase
+
+
+class PooledStatsSqliteDatabase(PoolStatsMixin, PooledSqliteDatabase):
+    """The pooled databases share their pool, sqlite needs no server"""
+
+
+def test_pool_counts_connections(tmp_path):
+    db = PooledStatsSqliteDatabase(
+        str(tmp_path / "pool.sqlite3"), max_connections=2, check_same_thread=False
+    )
+
+    db.connect()
+    db.connect(reuse_if_open=True)  # The connection of this thread is reused
+    assert db.get_stats()["in_use"] == 1
+
+    # A second thread takes the second connection of the pool
+    taken = threading.Event()
+    release = threading.Event()
+
+    def use_connection():
+        db.connect()
+        taken.set()
+        release.wait()
+        db.close()
+
+    thread = threading.Thread(target=use_connection)
+    thread.start()
+    taken.wait()
+    stats = db.get_stats()
+    assert stats["in_use"] == 2
+    assert stats["utilisation"] == 1
+
+    release.set()
+    thread.join()
+    db.close()
+    db.close()  # Closing a closed connection changes nothing
+
+    stats = db.get_stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 2
+    assert stats["acquired"] == 2
+    assert stats["waited"] == 0
+    db.close_all()
+
+
+def test_pool_counts_waiting_acquires(tmp_path):
+    db = PooledStatsSqliteDatabase(
+        str(tmp_path / "pool.sqlite3"),
+        max_connections=1,
+        timeout=5,
+        check_same_thread=False,
+    )
+    db.connect()
+
+    acquired = threading.Event()
+
+    def wait_for_connection():
+        db.connect()
+        acquired.set()
+        db.close()
+
+    thread = threading.Thread(target=wait_for_connection)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    db.close()
+    thread.join()
+
+    stats = db.get_stats()
+    assert acquired.is_set()
+    assert stats["waited"] == 1
+    assert stats["max_wait_time"] >= 0.1
+    db.close_all()
+
+
+def test_pooled_server_databases_provide_stats():
+    for database in (PooledStatsMySQLDatabase, PooledStatsPostgresqlDatabase):
+        db = database("skirmish", max_connections=4, host="localhost")
+        stats = db.get_stats()
+
+        assert stats["pooled"] is True
+        assert stats["max_connections"] == 4
+        assert stats["in_use"] == 0
+        assert stats["idle"] == 0
@@ -0,0 +1,46 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import msgpack
+
+from skirmserv.communication.encoding import FIELD_IDS, get_encoding
+
+
+def test_msgpack_roundtrip():
+    encoding = get_encoding("msgpack")
+    message = {"a": [8], "p_h": 90, "unknown": 1}
+
+    raw = encoding.encode(message)
+    assert msgpack.unpackb(raw, strict_map_key=False)[FIELD_IDS["a"]] == [8]
+    assert encoding.decode(raw) == message
+
+
+def test_msgpack_decodes_lists():
+    encoding = get_encoding("msgpack")
+    raw = msgpack.packb([{FIELD_IDS["a"]: [0]}, 5])
+
+    assert encoding.decode(raw) == [{"a": [0]}, None]
+
+
+def test_msgpack_malformed_messages():
+    encoding = get_encoding("msgpack")
+
+    assert encoding.decode(b"\xc1") is None  # Never used type byte
+    assert encoding.decode(b"\x92\x01") is None  # Truncated array
+    assert encoding.decode(msgpack.packb(1) + b"\x01") is None  # Extra data
+    assert encoding.decode(msgpack.packb(5)) is None
+    assert encoding.decode(msgpack.packb("text")) is None
+
+
+def test_msgpack_keeps_decoded_messages():
+    assert get_encoding("msgpack").decode({"a": [0]}) == {"a": [0]}
+
+
+def test_unknown_encodings_fall_back_to_json():
+    assert get_encoding("unknown").name == "json"
+    assert get_encoding(None).name == "json"
+    assert get_encoding(["msgpack"]).name == "json"
+    assert get_encoding({"msgpack": 1}).name == "json"
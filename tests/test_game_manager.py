@@ -0,0 +1,78 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import time
+
+import pytest
+
+from skirmserv.game.game import Game
+from skirmserv.game.game_manager import GameManager
+from skirmserv.gamemodes import Deathmatch
+
+
+class FakeClient(object):
+    """Client of a phaser, leaving the game removes its player"""
+
+    def __init__(self, game, pid, connection_closed):
+        self.game = game
+        self.pid = pid
+        self.connection_closed = connection_closed  # 0 while connected
+
+    def reset(self):
+        self.game.players.pop(self.pid)
+
+
+class FakePlayer(object):
+    def __init__(self, client):
+        self.client = client
+
+
+@pytest.fixture
+def manager(app, monkeypatch):
+    """Returns a new game manager closing games idle for 900 seconds"""
+    monkeypatch.setattr(GameManager, "instance", None)
+    manager = GameManager.get_instance()
+    manager.idle_timeout = 900
+    manager.max_age = 0
+    return manager
+
+
+def add_game(manager, gid, age, connection_closed=None):
+    """Adds a game created age seconds ago, with a phaser if
+    connection_closed is given"""
+    game = Game(Deathmatch, gid, None)
+    game.created_at = time.time() - age
+    if connection_closed is not None:
+        client = FakeClient(game, 1, connection_closed)
+        game.players.update({1: FakePlayer(client)})
+    manager.games.update({gid: game})
+    return game
+
+
+def test_abandoned_games_are_closed(manager):
+    now = time.time()
+    add_game(manager, "empty", 1000)
+    add_game(manager, "new", 10)
+    add_game(manager, "left", 1000, connection_closed=now - 1000)
+    add_game(manager, "returning", 1000, connection_closed=now - 10)
+    add_game(manager, "connected", 1000, connection_closed=0)
+
+    assert GameManager.reap_games() == {"abandoned": 2, "expired": 0}
+    assert sorted(manager.games) == ["connected", "new", "returning"]
+    assert GameManager.get_stats()["reaped_abandoned"] == 2
+
+
+def test_old_games_are_closed_without_connected_phasers(manager):
+    now = time.time()
+    manager.max_age = 60
+    add_game(manager, "new", 10)
+    add_game(manager, "old", 100)
+    add_game(manager, "left", 100, connection_closed=now - 10)
+    add_game(manager, "connected", 100000, connection_closed=0)
+
+    assert GameManager.reap_games() == {"abandoned": 0, "expired": 2}
+    assert sorted(manager.games) == ["connected", "new"]
+    assert GameManager.get_stats()["reaped_expired"] == 2
@@ -0,0 +1,131 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.communication.encoding import get_encoding
+from skirmserv.communication.outbound import OutboundQueue
+
+
+class FakeClient(object):
+    def __init__(self, socketio):
+        self.socket_id = "sid"
+        self.socketio = socketio
+        self.encoding = get_encoding("json")
+
+
+def create_queue(socketio, size=2, max_in_flight=2, ack=True):
+    queue = OutboundQueue(FakeClient(socketio), size, max_in_flight)
+    queue.connect(ack)
+    return queue
+
+
+def messages(socketio):
+    return [data for event, data, callback in socketio.emitted]
+
+
+def test_emits_directly_without_ack(socketio):
+    queue = create_queue(socketio, ack=False)
+    for i in range(10):
+        queue.put({"a": [], "seq": i})
+
+    assert len(socketio.emitted) == 10
+    assert socketio.emitted[0][2] is None
+    assert queue.get_stats()["depth"] == 0
+
+
+def test_queues_unacknowledged_messages(socketio):
+    queue = create_queue(socketio, size=4, max_in_flight=2)
+    for i in range(4):
+        queue.put({"a": [], "seq": i})
+
+    assert messages(socketio) == [{"a": [], "seq": 0}, {"a": [], "seq": 1}]
+    assert queue.get_stats()["in_flight"] == 2
+    assert queue.get_depth() == 2
+
+    socketio.acknowledge()
+    socketio.run_tasks()
+
+    assert [m["seq"] for m in messages(socketio)] == [0, 1, 2, 3]
+    assert queue.get_stats()["acked"] == 2
+    assert queue.get_stats()["in_flight"] == 2
+
+
+def test_drain_waits_for_acknowledgements(socketio):
+    queue = create_queue(socketio, size=4, max_in_flight=1)
+    for i in range(3):
+        queue.put({"a": [], "seq": i})
+
+    # Every sleep of the drain task acknowledges the next message
+    socketio.on_sleep = lambda: socketio.emitted[queue.acked_count][2]()
+    socketio.run_tasks()
+
+    assert [m["seq"] for m in messages(socketio)] == [0, 1, 2]
+
+
+def test_coalesce_keeps_all_actions(socketio):
+    queue = create_queue(socketio, size=1, max_in_flight=1)
+    queue.put({"a": [], "seq": 0})
+    queue.put({"a": [8], "p_h": 90, "seq": 1})
+    queue.put({"a": [8, 10], "p_h": 80, "name": "Phaser", "seq": 2})
+    queue.put({"a": [8], "p_p": 500, "seq": 3})
+
+    assert queue.get_depth() == 1
+    assert queue.get_stats()["coalesced"] == 2
+
+    socketio.acknowledge()
+    socketio.run_tasks()
+
+    assert messages(socketio)[1] == {
+        "a": [8, 8, 10, 8],
+        "p_h": 80,
+        "p_p": 500,
+        "name": "Phaser",
+        "seq": 3,
+    }
+
+
+def test_coalesce_does_not_change_queued_message(socketio):
+    queue = create_queue(socketio, size=1, max_in_flight=1)
+    queued = {"a": [8], "p_h": 90}
+    queue.put({"a": []})
+    queue.put(queued)
+    queue.put({"a": [9], "p_h": 80})
+
+    assert queued == {"a": [8], "p_h": 90}
+
+
+def test_overflow_disconnects_on_conflicting_parameters(socketio):
+    queue = create_queue(socketio, size=1, max_in_flight=1)
+    queue.put({"a": []})
+    queue.put({"a": [9], "hpmode": 1})
+    queue.put({"a": [9], "hpmode": 2})
+
+    assert socketio.server.disconnected == ["sid"]
+    assert queue.get_depth() == 0
+    assert queue.get_stats()["overflows"] == 1
+
+
+def test_overflow_disconnects_on_other_event(socketio):
+    queue = create_queue(socketio, size=1, max_in_flight=1)
+    queue.put({"a": []})
+    queue.put({"a": [11]})
+    queue.put({"a": [12]}, event="other")
+
+    assert socketio.server.disconnected == ["sid"]
+
+
+def test_connect_ignores_old_acknowledgements(socketio):
+    queue = create_queue(socketio, size=4, max_in_flight=2)
+    for i in range(3):
+        queue.put({"a": [], "seq": i})
+
+    queue.connect(True)
+    assert queue.get_depth() == 0 and queue.in_flight == 0
+
+    queue.put({"a": [], "seq": 3})
+    socketio.acknowledge(2)  # The messages sent before connecting again
+
+    assert queue.in_flight == 1
+    assert queue.get_stats()["acked"] == 0
@@ -0,0 +1,114 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from skirmserv.communication.client import SocketClient
+from skirmserv.game.game import Game
+from skirmserv.game.game_manager import GameManager
+from skirmserv.game.team import Team
+from skirmserv.gamemodes import Deathmatch
+
+
+@pytest.fixture
+def game(app, socketio):
+    """Returns a game with the players A, B and C"""
+    game = Game(Deathmatch, "pgt", SimpleNamespace(name="A"))
+    for name in ("A", "B", "C"):
+        client = SocketClient(name, SimpleNamespace(name=name), socketio)
+        GameManager.join_game(game, client)
+    return game
+
+
+def player(game: Game, name: str):
+    return next(p for p in game.players.values() if p.name == name)
+
+
+def last_sent(game: Game, name: str) -> dict:
+    """Returns the last message sent to the client of the player"""
+    return player(game, name).client.replay_buffer[-1]
+
+
+def update_all(game: Game) -> dict:
+    """Updates all clients, returns the messages sent by the update (key is
+    the name of the player)"""
+    seqs = {p.name: p.client.seq for p in game.players.values()}
+    for p in game.players.values():
+        p.client.update()
+
+    return {
+        p.name: p.client.replay_buffer[-1]
+        for p in game.players.values()
+        if p.client.seq > seqs[p.name]
+    }
+
+
+def test_rank_is_sent_to_the_players_with_changed_rank(game):
+    player(game, "A").points = 30
+    player(game, "B").points = 20
+    player(game, "C").points = 10
+    update_all(game)
+
+    # C overtakes B, the rank of A does not change
+    player(game, "C").points = 25
+    sent = update_all(game)
+
+    assert sent.keys() == {"B", "C"}
+    assert sent["B"]["p_r"] == 3
+    assert sent["C"]["p_r"] == 2
+    assert sent["C"]["p_p"] == 25
+    assert "p_p" not in sent["B"]
+
+
+def test_team_change_sends_the_new_team(game):
+    red = Team(game, 1, "Red")
+    blue = Team(game, 2, "Blue")
+    game.add_team(red)
+    game.add_team(blue)
+    game.move_player_to_team(player(game, "A"), red)
+    update_all(game)
+
+    player(game, "A").points = 5
+    update_all(game)
+
+    game.move_player_to_team(player(game, "A"), blue)
+    sent = last_sent(game, "A")
+    assert sent["t_id"] == 2
+    assert sent["t_n"] == "Blue"
+    assert sent["t_pc"] == 1
+    assert sent["t_p"] == 5
+    assert sent["t_r"] == 1
+
+
+def test_same_value_is_not_a_change(game):
+    a = player(game, "A")
+    update_all(game)
+
+    version = a.pgt_version
+    a.health = a.health
+    a.name = "A"
+    a.color = list(a.color)
+
+    assert a.pgt_version == version
+    assert update_all(game) == {}
+
+
+def test_full_update_sends_all_fields(game):
+    a = player(game, "A")
+    team = Team(game, 1, "Red")
+    game.add_team(team)
+    game.move_player_to_team(a, team)
+    update_all(game)
+
+    a.client.update(full=True)
+    sent = last_sent(game, "A")
+
+    expected = {}
+    for source in (a, team, game):
+        expected.update(source.get_pgt_data())
+    assert {k: v for k, v in sent.items() if k in expected} == expected
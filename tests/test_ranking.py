@@ -0,0 +1,62 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.util.ranking import RankIndex
+
+
+def test_ranks_ordered_by_points():
+    index = RankIndex()
+    index.add("a", 100)
+    index.add("b", 300)
+    index.add("c", 200)
+
+    assert index.get_ranks() == {"b": 1, "c": 2, "a": 3}
+    assert index.get_rank("a") == 3
+    assert index.get_rank("unknown") == -1
+    assert len(index) == 3 and "a" in index
+
+
+def test_same_points_last_added_first():
+    index = RankIndex()
+    index.add("a", 0)
+    index.add("b", 0)
+
+    assert index.get_rank("b") == 1
+    assert index.get_rank("a") == 2
+
+
+def test_add_returns_items_behind():
+    index = RankIndex()
+    index.add("a", 300)
+    index.add("b", 100)
+
+    assert index.add("c", 200) == ["c", "b"]
+
+
+def test_update_returns_items_between_positions():
+    index = RankIndex()
+    for item, points in (("a", 400), ("b", 300), ("c", 200), ("d", 100)):
+        index.add(item, points)
+
+    assert sorted(index.update("c", 350)) == ["b", "c"]
+    assert index.get_ranks() == {"a": 1, "c": 2, "b": 3, "d": 4}
+
+    # Unchanged points or unknown items change no rank
+    assert index.update("c", 350) == []
+    assert index.update("unknown", 0) == []
+
+
+def test_remove_returns_items_behind():
+    index = RankIndex()
+    for item, points in (("a", 300), ("b", 200), ("c", 100)):
+        index.add(item, points)
+
+    assert index.remove("a") == ["b", "c"]
+    assert index.get_ranks() == {"b": 1, "c": 2}
+    assert index.remove("a") == []
+
+    index.clear()
+    assert len(index) == 0
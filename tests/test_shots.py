@@ -0,0 +1,81 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.util.shots import ShotStore, ShotWindow
+
+
+def test_shot_hits_every_player_once():
+    window = ShotWindow(size=4)
+
+    assert not window.hit(1, 2)
+    assert not window.hit(1, 3)
+    assert window.hit(1, 2)
+    assert window.hit(1, 3)
+    assert not window.hit(2, 2)
+
+
+def test_large_pids_use_no_more_memory():
+    small = ShotWindow(size=4)
+    large = ShotWindow(size=4)
+    small.hit(1, 2)
+    large.hit(1, 2**40)
+
+    assert large.hit(1, 2**40)
+    assert not large.hit(1, 2)
+    assert large.get_memory_estimate() <= small.get_memory_estimate() + 64
+
+
+def test_old_shots_leave_the_window():
+    window = ShotWindow(size=4)
+    for sid in range(4):
+        window.hit(sid, 1)
+
+    # Still within the window
+    assert window.hit(0, 1)
+
+    # Shot 0 is evicted by shot 4, it is too old to count
+    window.hit(4, 1)
+    assert window.hit(0, 2)
+    assert not window.hit(1, 2)
+    assert window.hit(1, 1)
+
+
+def test_sid_wraps_around():
+    window = ShotWindow(size=4, id_range=16)
+    window.hit(14, 1)
+    window.hit(15, 1)
+
+    # 0 and 1 follow 15
+    assert not window.hit(0, 1)
+    assert not window.hit(1, 1)
+    assert window.hit(15, 1)
+    assert window.hit(0, 1)
+    assert window.hit(14, 1)
+
+
+def test_too_old_shots_are_ignored():
+    window = ShotWindow()
+    assert not window.hit(1000, 5)
+    assert window.hit(1000, 5)
+
+    # A late packet of a shot older than the window does not reset it
+    assert window.hit(500, 6)
+    assert window.hit(1000, 5)
+    assert not window.hit(1001, 5)
+
+
+def test_remove_forgets_the_player():
+    store = ShotStore(size=4)
+    assert not store.hit(1, 10, 2)
+    assert not store.hit(2, 10, 1)
+    assert len(store) == 2
+
+    # The pid 2 is used by a new player
+    store.remove(2)
+    assert len(store) == 1
+    assert not store.hit(1, 10, 2)
+    assert not store.hit(2, 10, 1)
+    assert store.hit(2, 10, 1)
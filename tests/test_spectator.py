@@ -0,0 +1,61 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from skirmserv.communication.spectator import Spectator
+from skirmserv.game.game import Game
+from skirmserv.gamemodes import Deathmatch
+
+
+@pytest.fixture
+def game(app, monkeypatch, timers, clock):
+    """Returns a game with a spectator, at most 10 frames per second"""
+    monkeypatch.setitem(app.config, "SPECTATOR_FRAME_RATE", 10)
+    game = Game(Deathmatch, "spectated", SimpleNamespace(name="Phaser"))
+    Spectator("spectator", game, timers.socketio)
+    return game
+
+
+def frames(socketio):
+    return [data for event, data, callback in socketio.emitted if event == "spectate"]
+
+
+def test_updates_within_the_interval_are_one_frame(game, socketio, timers, clock):
+    room = game.spectator_room
+    room.update()
+    assert len(frames(socketio)) == 2  # Snapshot of the new spectator and frame
+
+    clock.now += 0.02
+    game.start_time = 1100
+    game.mark_changed("start_time")
+    room.update()
+    clock.now += 0.02
+    room.update()
+    assert len(frames(socketio)) == 2
+    assert len(game.timers) == 1
+
+    timers.run_due(clock.now + 0.1)
+    assert len(frames(socketio)) == 3
+    assert frames(socketio)[-1]["pgt"]["game"]["g_st"] == 1100
+    assert game.timers == set()
+
+
+def test_scheduled_frame_is_cancelled_on_close(game, socketio, timers, clock):
+    room = game.spectator_room
+    room.update()
+    clock.now += 0.02
+    room.update()
+    assert len(game.timers) == 1
+
+    # The last frame is sent by close, not by the timer
+    game.close()
+    count = len(frames(socketio))
+    assert room.frame_timer is None
+    assert timers.run_due(clock.now + 1) == 0
+    assert len(frames(socketio)) == count
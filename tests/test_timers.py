@@ -0,0 +1,93 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from skirmserv.game.game import Game
+from skirmserv.game.timer_service import TimerService
+from skirmserv.gamemodes import Deathmatch
+
+
+def test_timers_are_called_in_order(timers):
+    called = []
+    TimerService.call_at(30, called.append, "third")
+    TimerService.call_at(10, called.append, "first")
+    TimerService.call_at(20, called.append, "second")
+    TimerService.call_at(20, called.append, "second again")
+
+    assert timers.run_due(5) == 0
+    assert timers.run_due(20) == 3
+    assert called == ["first", "second", "second again"]
+    assert TimerService.get_stats() == {"pending": 1, "fired": 3, "failed": 0}
+
+
+def test_earlier_timer_wakes_up_the_loop(timers):
+    TimerService.call_at(20, print)
+    timers.wakeup.clear()
+
+    TimerService.call_at(30, print)
+    assert not timers.wakeup.is_set()
+    TimerService.call_at(10, print)
+    assert timers.wakeup.is_set()
+
+
+def test_cancelled_timer_is_not_called(timers):
+    called = []
+    timer = TimerService.call_at(10, called.append, "cancelled")
+    TimerService.call_at(10, called.append, "called")
+
+    timer.cancel()
+    assert not timer.is_pending()
+    assert TimerService.get_stats()["pending"] == 1
+
+    assert timers.run_due(10) == 1
+    assert called == ["called"]
+    assert timers.cancelled_count == 0
+
+
+def test_failed_timer_is_counted(timers):
+    called = []
+    TimerService.call_at(10, int, "not a number")
+    TimerService.call_at(10, called.append, "called")
+
+    assert timers.run_due(10) == 2
+    assert called == ["called"]
+    assert TimerService.get_stats() == {"pending": 0, "fired": 2, "failed": 1}
+
+
+def test_cancelled_timers_are_compacted(timers):
+    cancelled = [TimerService.call_at(10, print) for i in range(100)]
+    TimerService.call_at(20, print)
+
+    for timer in cancelled[:64]:
+        timer.cancel()
+    assert len(timers.heap) == 101
+
+    # More than 64 and more than half of the timers are cancelled
+    cancelled[64].cancel()
+    assert len(timers.heap) == 36
+    assert timers.cancelled_count == 0
+    assert TimerService.get_stats()["pending"] == 36
+
+
+def test_game_forgets_finished_timers(timers):
+    game = Game(Deathmatch, "timers", None)
+    called = []
+
+    game.call_at(10, called.append, "called")
+    cancelled = game.call_at(10, called.append, "cancelled")
+    closed = game.call_at(20, called.append, "closed")
+    assert len(game.timers) == 3
+
+    cancelled.cancel()
+    assert len(game.timers) == 2
+
+    timers.run_due(10)
+    assert called == ["called"]
+    assert game.timers == {closed}
+
+    game.close()
+    assert game.timers == set()
+    assert not closed.is_pending()
+    assert timers.run_due(20) == 0
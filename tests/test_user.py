@@ -0,0 +1,84 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+from argon2 import PasswordHasher
+
+from skirmserv.models.user import UserModel
+
+
+def test_check_password(app):
+    user = UserModel.register("Phaser", "check@example.com", "secret")
+
+    assert user.check_password("secret")
+    assert not user.check_password("wrong")
+
+    user.password = "not an argon2 hash"
+    assert not user.check_password("secret")
+
+
+def test_rehash_writes_only_the_password(app, monkeypatch):
+    user = UserModel.register("Phaser", "rehash@example.com", "secret")
+    old_hash = user.password
+
+    # Changed argon2 parameters
+    monkeypatch.setattr(
+        UserModel,
+        "password_hasher",
+        PasswordHasher(time_cost=2, memory_cost=1024, parallelism=1),
+    )
+
+    user.name = "Changed"
+    assert user.check_password("secret")
+
+    stored = UserModel.get_by_id(user.id)
+    assert stored.password != old_hash
+    assert stored.password == user.password
+    assert stored.name == "Phaser"
+    assert stored.check_password("secret")
+
+
+def test_signed_tokens_without_token_cache(app, monkeypatch):
+    monkeypatch.setitem(app.config, "SECRET_KEY", "test")
+    monkeypatch.setitem(app.config, "ACCESS_TOKEN_FORMAT", "signed")
+    monkeypatch.setitem(app.config, "TOKEN_CACHE_SIZE", 0)
+    for attribute in ("token_cache", "token_generations", "token_serializer"):
+        monkeypatch.setattr(UserModel, attribute, None)
+
+    user = UserModel.register("Phaser", "signed@example.com", "secret")
+    old_token = user.generate_access_token()
+    token = user.generate_access_token()
+
+    # The generations are known without the token cache
+    generations = UserModel.get_token_generations()
+    hits = generations.get_stats()["hits"]
+    assert UserModel.authenticate_by_token(token).id == user.id
+    assert UserModel.authenticate_by_token(old_token) is None
+    assert generations.get_stats()["hits"] == hits + 2
+
+    # Unknown generations (like after a restart) are checked once against
+    # the database
+    generations.clear()
+    assert UserModel.authenticate_by_token(old_token) is None
+    assert UserModel.authenticate_by_token(token).id == user.id
+    assert len(generations) == 1
+
+
+def test_new_token_revokes_the_stored_token(app):
+    user = UserModel.register("Phaser", "rotate@example.com", "secret")
+    old_token = user.generate_access_token()
+    assert UserModel.authenticate_by_token(old_token).id == user.id
+
+    # An instance loaded before the token was generated does not know the
+    # stored token, it is revoked anyway
+    stale = UserModel.get_by_id(user.id)
+    stored_token = user.generate_access_token()
+    assert UserModel.authenticate_by_token(stored_token).id == user.id
+    token = stale.generate_access_token()
+
+    assert UserModel.get_by_id(user.id).access_token == stale.access_token
+    assert UserModel.authenticate_by_token(old_token) is None
+    assert UserModel.authenticate_by_token(stored_token) is None
+    assert UserModel.authenticate_by_token(token).id == user.id
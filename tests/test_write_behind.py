@@ -0,0 +1,124 @@
+"""
+Skirmish Server
+
+Copyright (C) 2022 Ole Lange
+"""
+
+import pytest
+
+from skirmserv.models.user import UserModel
+from skirmserv.models.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def queue(app, monkeypatch, socketio):
+    """Returns a new queue, writes are queued until the test flushes them"""
+    monkeypatch.setitem(app.config, "DB_WRITE_BEHIND", "sync")
+    monkeypatch.setitem(app.config, "DB_WRITE_BATCH_SIZE", 3)
+    monkeypatch.setattr(WriteBehindQueue, "instance", None)
+
+    queue = WriteBehindQueue.get_instance()
+    queue.sync = False
+    queue.socketio = socketio
+    queue.wakeup = socketio.server.eio.create_event()
+    return queue
+
+
+def rename(user_id, name):
+    UserModel.update(name=name).where(UserModel.id == user_id).execute()
+    return name
+
+
+def rename_and_fail(user_id, name):
+    rename(user_id, name)
+    raise ValueError("write failed")
+
+
+def test_writes_are_queued_until_flushed(queue):
+    user = UserModel.register("Phaser", "queued@example.com", "secret")
+
+    write = WriteBehindQueue.put(rename, user.id, "Queued")
+    assert not write.done
+    assert UserModel.get_by_id(user.id).name == "Phaser"
+    assert WriteBehindQueue.get_stats()["queued"] == 1
+
+    queue.flush()
+    assert write.done
+    assert write.result() == "Queued"
+    assert UserModel.get_by_id(user.id).name == "Queued"
+    assert WriteBehindQueue.get_stats() == {
+        "queued": 0,
+        "written": 1,
+        "failed": 0,
+        "flushes": 1,
+    }
+
+
+def test_result_writes_all_queued_writes_in_order(queue):
+    user = UserModel.register("Phaser", "order@example.com", "secret")
+
+    first = WriteBehindQueue.put(rename, user.id, "First")
+    second = WriteBehindQueue.put(rename, user.id, "Second")
+
+    assert second.result() == "Second"
+    assert first.done
+    assert UserModel.get_by_id(user.id).name == "Second"
+    assert queue.flush_count == 1
+
+
+def test_full_batch_is_written_in_the_background(queue):
+    user = UserModel.register("Phaser", "batch@example.com", "secret")
+
+    for i in range(3):
+        WriteBehindQueue.put(rename, user.id, str(i))
+
+    # Only one flush is scheduled for a full batch
+    WriteBehindQueue.put(rename, user.id, "3")
+    assert queue.socketio.tasks == [(queue.flush, ())]
+
+    function, args = queue.socketio.tasks.pop()
+    function(*args)
+    assert queue.written_count == 4
+    assert not queue.flushing
+
+
+def test_failed_write_does_not_undo_the_others(queue):
+    first = UserModel.register("Phaser", "first@example.com", "secret")
+    second = UserModel.register("Phaser", "second@example.com", "secret")
+
+    failed = WriteBehindQueue.put(rename_and_fail, first.id, "Failed")
+    written = WriteBehindQueue.put(rename, second.id, "Written")
+    queue.flush()
+
+    with pytest.raises(ValueError):
+        failed.result()
+    assert written.result() == "Written"
+
+    # The savepoint of the failed write is rolled back
+    assert UserModel.get_by_id(first.id).name == "Phaser"
+    assert UserModel.get_by_id(second.id).name == "Written"
+    assert queue.failed_count == 1
+    assert queue.written_count == 1
+
+
+def test_sync_writes_directly(queue):
+    user = UserModel.register("Phaser", "sync@example.com", "secret")
+    queue.sync = True
+
+    write = WriteBehindQueue.put(rename, user.id, "Sync")
+    assert write.done
+    assert UserModel.get_by_id(user.id).name == "Sync"
+    assert queue.socketio.tasks == []
+
+
+def test_first_write_wakes_up_the_flusher(queue):
+    user = UserModel.register("Phaser", "wakeup@example.com", "secret")
+    assert not queue.wakeup.is_set()
+
+    WriteBehindQueue.put(rename, user.id, "First")
+    assert queue.wakeup.is_set()
+
+    # The flusher is already awake for the following writes
+    queue.wakeup.clear()
+    WriteBehindQueue.put(rename, user.id, "Second")
+    assert not queue.wakeup.is_set()